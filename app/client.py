@@ -0,0 +1,90 @@
+import os, sys, json, stat, socket, struct
+
+
+SOCKET_ENV = "PERSONAL_SHELL_SOCKET"
+SOCKET_NAME = "daemon.sock"
+HEADER_SIZE = 4
+STATUS_SIZE = 4
+# struct ucred: pid, uid, gid
+PEER_CREDENTIALS = struct.Struct("iII")
+
+
+# Kept Free of Shell Imports so Starting the Client Costs Only the Interpreter Itself
+def socket_path() -> str:
+    return os.environ.get(SOCKET_ENV) or os.path.join(socket_dir(), SOCKET_NAME)
+
+
+# The Per-User Runtime Directory When the Session Has One, Otherwise a Private One in /tmp
+def socket_dir() -> str:
+    if runtime_dir := os.environ.get("XDG_RUNTIME_DIR", None):
+        return os.path.join(runtime_dir, "personal-shell")
+    return f"/tmp/personal-shell-{os.getuid()}"
+
+
+# Creates the Directory Holding the Socket, Refusing One Another User Made or Can Enter
+def make_socket_dir(directory: str) -> None:
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError(f"{directory}: not a directory owned by this user")
+    if info.st_mode & 0o077:
+        raise PermissionError(f"{directory}: accessible to other users")
+
+
+# Uid of the Process at the Other End, From SO_PEERCRED Where the Platform Has it and
+# Otherwise From the Owner of the Socket File
+def peer_uid(connection: socket.socket, path: str) -> int:
+    if hasattr(socket, "SO_PEERCRED"):
+        credentials = connection.getsockopt(
+            socket.SOL_SOCKET, socket.SO_PEERCRED, PEER_CREDENTIALS.size
+        )
+        return PEER_CREDENTIALS.unpack(credentials)[1]
+    return os.stat(path).st_uid
+
+
+# Hands argv, cwd, the Environment and stdin, stdout and stderr to the Daemon, Returning its Status
+def request(argv: list[str], path: str | None = None) -> int:
+    body = json.dumps({"argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)}).encode()
+    path = path or socket_path()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path)
+        # The Environment and Standard Streams Go Only to a Daemon Run by This User
+        if peer_uid(connection, path) != os.getuid():
+            raise PermissionError(f"{path}: daemon belongs to another user")
+        message = len(body).to_bytes(HEADER_SIZE, "big") + body
+        sent = socket.send_fds(connection, [message], [0, 1, 2])
+        if sent < len(message):
+            connection.sendall(message[sent:])
+
+        status = b""
+        while len(status) < STATUS_SIZE and (chunk := connection.recv(STATUS_SIZE - len(status))):
+            status += chunk
+    if len(status) < STATUS_SIZE:
+        return 1
+    return int.from_bytes(status, "big", signed=True)
+
+
+def main() -> None:
+    argv = sys.argv[1:]
+    # Interactive Sessions and Missing Daemons Fall Back to a Shell of Our Own
+    if not argv and sys.stdin.isatty():
+        local_shell(argv)
+    try:
+        status = request(argv)
+    except (FileNotFoundError, ConnectionRefusedError):
+        local_shell(argv)
+    except PermissionError as e:
+        sys.stderr.write(f"personal-shell: {e}\n")
+        local_shell(argv)
+    sys.exit(status & 0xFF)
+
+
+def local_shell(argv: list[str]) -> None:
+    os.execv(sys.executable, [sys.executable, "-m", "app.main", *argv])
+
+
+if __name__ == "__main__":
+    main()
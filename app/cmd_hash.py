@@ -0,0 +1,172 @@
+import os, stat
+
+
+class CommandHash:
+    def __init__(self) -> None:
+        # Name -> (Resolved Path, Directory It Was Found In or None if Pinned by hash -p)
+        self._table: dict[str, tuple[str, str | None]] = {}
+        self._hits: dict[str, int] = {}
+        self._dir_mtimes: dict[str, int] = {}
+        self._path: str | None = None
+        self._dirs: list[str] = []
+
+    # Drops Every Remembered Location When $PATH Itself Changes
+    def _check_path(self) -> None:
+        current_path = os.environ.get("PATH", "")
+        if current_path != self._path:
+            self._path = current_path
+            # Empty PATH Entries Mean the Current Directory
+            self._dirs = [path or "." for path in current_path.split(os.pathsep)]
+            self.clear()
+
+    def clear(self) -> None:
+        self._table.clear()
+        self._hits.clear()
+        self._dir_mtimes.clear()
+
+    def forget(self, name: str) -> bool:
+        self._hits.pop(name, None)
+        return self._table.pop(name, None) is not None
+
+    def pin(self, name: str, file_path: str) -> None:
+        self._check_path()
+        self._table[name] = (file_path, None)
+        self._hits[name] = 0
+
+    # hash name: Searches $PATH Afresh and Records the Result With No Hits, Like bash
+    def learn(self, name: str) -> str | None:
+        self._check_path()
+        if "/" in name:
+            return name if is_executable(name) else None
+        file_path, directory = self._walk(name)
+        if file_path is not None:
+            self._hits[name] = 0
+        return self._remember(name, file_path, directory, hit=False)
+
+    # Copies of the Table so a Subshell's Changes Can be Thrown Away
+    def snapshot(self) -> tuple[dict, dict, dict]:
+        self._check_path()
+        return dict(self._table), dict(self._hits), dict(self._dir_mtimes)
+
+    def restore(self, state: tuple[dict, dict, dict]) -> None:
+        self._table, self._hits, self._dir_mtimes = state
+
+    # Lists Remembered Commands in Insertion Order as (Name, Path, Hits)
+    def entries(self) -> list[tuple[str, str, int]]:
+        self._check_path()
+        return [
+            (name, file_path, self._hits.get(name, 0))
+            for name, (file_path, _) in self._table.items()
+        ]
+
+    # Resolves a Command Name, Stat-ing Only its Own Directory on a Hit
+    def find(self, name: str) -> str | None:
+        self._check_path()
+
+        # Names With Slashes Bypass PATH Lookup Entirely
+        if "/" in name:
+            return name if is_executable(name) else None
+
+        if entry := self._table.get(name, None):
+            file_path, directory = entry
+            if directory is None or self._dir_unchanged(directory):
+                self._hits[name] += 1
+                return file_path
+
+            # Directory Was Modified, Invalidate Everything Learned From It
+            self._invalidate_dir(directory)
+
+        return self._remember(name, *self._walk(name))
+
+    # Resolves Many Names in a Single Pass Over $PATH
+    def find_all(
+        self, names: list[str], all_matches: bool = False
+    ) -> dict[str, list[str]]:
+        self._check_path()
+        found = {name: [] for name in names}
+        pending = []
+        for name in found:
+            if "/" in name:
+                if is_executable(name):
+                    found[name].append(name)
+            elif not all_matches and (file_path := self.find_cached(name)):
+                found[name].append(file_path)
+            else:
+                pending.append(name)
+
+        for directory in self._dirs:
+            if not pending:
+                break
+            for name in list(pending):
+                file_path = os.path.join(directory, name)
+                if not is_executable(file_path):
+                    continue
+                if not found[name]:
+                    self._remember(name, file_path, directory, hit=False)
+                found[name].append(file_path)
+                if not all_matches:
+                    pending.remove(name)
+        return found
+
+    # Returns a Remembered Location Without Walking $PATH On a Miss
+    def find_cached(self, name: str) -> str | None:
+        self._check_path()
+        if entry := self._table.get(name, None):
+            file_path, directory = entry
+            if directory is None or self._dir_unchanged(directory):
+                return file_path
+            self._invalidate_dir(directory)
+        return None
+
+    def _walk(self, name: str) -> tuple[str | None, str | None]:
+        for directory in self._dirs:
+            file_path = os.path.join(directory, name)
+            if is_executable(file_path):
+                return file_path, directory
+        return None, None
+
+    def _remember(
+        self,
+        name: str,
+        file_path: str | None,
+        directory: str | None,
+        hit: bool = True,
+    ) -> str | None:
+        if file_path is None:
+            return None
+        if directory not in self._dir_mtimes:
+            mtime = dir_mtime(directory)
+            if mtime is None:
+                return file_path
+            self._dir_mtimes[directory] = mtime
+        self._table[name] = (file_path, directory)
+        self._hits[name] = self._hits.get(name, 0) + hit
+        return file_path
+
+    def _dir_unchanged(self, directory: str) -> bool:
+        return dir_mtime(directory) == self._dir_mtimes.get(directory, None)
+
+    def _invalidate_dir(self, directory: str) -> None:
+        self._dir_mtimes.pop(directory, None)
+        for name in [n for n, (_, d) in self._table.items() if d == directory]:
+            self.forget(name)
+
+
+def dir_mtime(directory: str) -> int | None:
+    try:
+        return os.stat(directory).st_mtime_ns
+    except OSError:
+        return None
+
+
+# One stat Plus One access Instead of exists/is_file/access Separately
+def is_executable(file_path: str) -> bool:
+    try:
+        if not stat.S_ISREG(os.stat(file_path).st_mode):
+            return False
+    except OSError:
+        return False
+    return os.access(file_path, os.X_OK)
+
+
+COMMAND_HASH = CommandHash()
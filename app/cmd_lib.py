@@ -1,67 +1,244 @@
-import sys, os, subprocess, io
-from app.utils import ExitStatus, Commands, Redirection
+import sys, os, io, re, signal, tempfile, contextlib
+from app.utils import ExitStatus, Commands, ForceExit, Redirection, is_terminal
 from pathlib import Path
-from typing import Callable
-from app.cmd_result import CommandResult, PipeCommandResult, PTYCommandResult
+from typing import Callable, TextIO
+from app.cmd_hash import COMMAND_HASH
+from app.spawn import PIPE, SpawnedProcess, capture, spawn, spawn_pty
+from app.trace import TRACER, traced
+from app.jobs import JobTable, JobState
+from app.history import open_history
+from app.native import NATIVES, Unsupported, enabled_natives
+from app.parallel import default_workers, run_parallel
+from app.memo import OUTPUT_CACHE, CacheOptions
+from app.parser import CommandList, FunctionDefinition, ParseError, parse, with_arguments
+from app import usage
+from app.cmd_result import (
+    CommandResult,
+    CapturedCommandResult,
+    PipeCommandResult,
+    PTYCommandResult,
+)
 
 
 DEFAULT_TERM = "xterm-256color"
+# parallel Exits With the Number of Failed Lines, Capped Like GNU parallel
+PARALLEL_FAILURE_CAP = 101
+# Characters That Would Change How a Line Splits Cannot Appear in an Alias Name
+ALIAS_NAME = re.compile(r"[^\s/$`'\"=|&;<>()\\]+")
+EXIT_STATUS_PATTERN = re.compile(r"[-+]?[0-9]+")
 TEST_NUM = 0
 
+# Builtins That Change Shell State Run Against Throwaway State Inside a Pipeline
+SUBSHELL_COMMANDS = {
+    Commands.EXIT.value,
+    Commands.CD.value,
+    Commands.HASH.value,
+    Commands.FG.value,
+    Commands.BG.value,
+    Commands.WAIT.value,
+    Commands.SET.value,
+    Commands.ENABLE.value,
+    Commands.ALIAS.value,
+    Commands.UNALIAS.value,
+}
 
+# Builtins That Read Their Piped Input, Which Must Stay Open Until They Run
+STDIN_COMMANDS = {
+    Commands.PARALLEL.value,
+    Commands.CACHED.value,
+}
+
+# Options Understood by set -o, Each Mapped to Whether it is Currently On
+SHELL_OPTIONS = {
+    "trace": lambda: TRACER.enabled,
+}
+
+
+@traced("find_which_path")
 def find_which_path(fn: str) -> str | None:
-    # Construct And Check Validity of Path to Possible File Input
-    paths = os.getenv("PATH", "").split(os.pathsep)
-    valid_file_path = next(
-        (
-            file_path
-            for file_path in (Path(path) / fn for path in paths)
-            if file_path.exists()
-            and file_path.is_file()
-            and os.access(file_path, os.X_OK)
-        ),
-        None,
-    )
-    return valid_file_path
+    # Resolve Through the Shared Hash Table, Only Walking PATH on a Miss
+    return COMMAND_HASH.find(fn)
 
 
 class CommandLibrary:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        interactive: bool = True,
+        call: Callable[[CommandList, Redirection, list[str] | None], int] | None = None,
+    ) -> None:
+        self.interactive = interactive
+        # Runs an Alias or Function Body in the Shell, Function Arguments Become $1, $2...
+        self.call = call
+        self.jobs = JobTable()
+        # Only Interactive Sessions are Recorded, Scripts Leave the History File Alone
+        self.history = open_history() if interactive else None
         self.command_lib = {
             Commands.EXIT.value: self.handle_exit,
             Commands.ECHO.value: self.handle_echo,
             Commands.TYPE.value: self.handle_type,
             Commands.PWD.value: self.handle_pwd,
             Commands.CD.value: self.handle_cd,
+            Commands.HASH.value: self.handle_hash,
+            Commands.WHICH.value: self.handle_which,
+            Commands.JOBS.value: self.handle_jobs,
+            Commands.FG.value: self.handle_fg,
+            Commands.BG.value: self.handle_bg,
+            Commands.WAIT.value: self.handle_wait,
+            Commands.SET.value: self.handle_set,
+            Commands.HISTORY.value: self.handle_history,
+            Commands.ENABLE.value: self.handle_enable,
+            Commands.PARALLEL.value: self.handle_parallel,
+            Commands.TIMES.value: self.handle_times,
+            Commands.ALIAS.value: self.handle_alias,
+            Commands.UNALIAS.value: self.handle_unalias,
+            Commands.CACHED.value: self.handle_cached,
+            Commands.CACHE.value: self.handle_cache,
         }
+        # Alias Name -> (Text as Written, Parsed Body), Function Name -> Parsed Definition
+        self.aliases: dict[str, tuple[str, CommandList]] = {}
+        self.functions: dict[str, FunctionDefinition] = {}
+        # Aliases Being Expanded Right Now, Never Expanded Again Inside Themselves
+        self._expanding: set[str] = set()
+        # Native Utilities Named in PERSONAL_SHELL_NATIVE Start Out Enabled
+        self.natives: set[str] = set()
+        self.set_natives(enabled_natives())
 
+    @traced("find_command")
     def find_command(
         self, context: Redirection, cmd: str, user_input: str
     ) -> Callable[[list[str]], CommandResult]:
 
+        # Aliases Come First, Then Functions, Then Builtins and PATH
+        if self.is_defined(cmd):
+            return self.handle_defined(context, cmd)
+
+        if cmd in self.natives:
+            return self.handle_native(context, cmd, user_input)
+
         if command_func := self.command_lib.get(cmd, None):
-            context.close_input()
+            if cmd not in STDIN_COMMANDS:
+                context.close_input()
             return lambda args: command_func(context, args)
+        return self.find_external(context, cmd, user_input)
 
-        # Search for Custom Command Case
-        if not find_which_path(cmd):
+    # Search for Custom Command Case
+    def find_external(
+        self, context: Redirection, cmd: str, user_input: str
+    ) -> Callable[[list[str]], CommandResult]:
+        if not (file_path := find_which_path(cmd)):
             return self.not_found(context, user_input)
 
-        if context.is_redirected():
-            return self.handle_custom_exec_pipe(context, cmd)
-        return self.handle_custom_exec_pty(context, cmd)
+        # Scripts Never Need a PTY, Children Share the Shell's Own Descriptors
+        if not self.interactive or context.is_redirected():
+            return self.handle_custom_exec_pipe(context, cmd, file_path)
+        return self.handle_custom_exec_pty(context, cmd, file_path)
+
+    # Builtins and Not Found Commands Never Need a Process, Natives Only Replace the Last Section
+    def runs_in_process(self, cmd: str) -> bool:
+        if self.is_defined(cmd):
+            return True
+        if cmd in self.natives:
+            return not find_which_path(cmd)
+        return cmd in self.command_lib or not find_which_path(cmd)
+
+    def is_defined(self, cmd: str) -> bool:
+        return cmd in self.functions or (cmd in self.aliases and cmd not in self._expanding)
+
+    def define(self, definition: FunctionDefinition) -> None:
+        self.functions[definition.name] = definition
+
+    # Swaps the Enabled Native Utilities, Keeping command_lib in Step
+    def set_natives(self, names: set[str]) -> None:
+        for name in self.natives - names:
+            del self.command_lib[name]
+        for name in names - self.natives:
+            self.command_lib[name] = NATIVES[name]
+        self.natives = set(names)
+
+    # State Changing Builtins Outside the Foreground Get Subshell Semantics Without a Fork
+    def isolation(self, cmd: str) -> contextlib.AbstractContextManager:
+        if cmd in SUBSHELL_COMMANDS or self.is_defined(cmd):
+            return self.subshell()
+        return contextlib.nullcontext()
+
+    # Restores the Working Directory, Hash Table, Jobs, Options and Definitions a Builtin Changed
+    @contextlib.contextmanager
+    def subshell(self):
+        cwd_fd = os.open(".", os.O_RDONLY)
+        hash_state = COMMAND_HASH.snapshot()
+        tracing = TRACER.enabled
+        natives = set(self.natives)
+        aliases, functions = dict(self.aliases), dict(self.functions)
+        # Subshells Have No Jobs of Their Own to Wait On or Resume
+        jobs, self.jobs = self.jobs, JobTable()
+        try:
+            yield
+        finally:
+            self.jobs.close()
+            self.jobs = jobs
+            self.set_natives(natives)
+            self.aliases, self.functions = aliases, functions
+            TRACER.enabled = tracing
+            COMMAND_HASH.restore(hash_state)
+            os.fchdir(cwd_fd)
+            os.close(cwd_fd)
+
+    # Finds a Spawner Wiring an External Command Straight to its Redirection Files
+    def find_spawner(
+        self, context: Redirection, cmd: str
+    ) -> Callable[[list[str], int | None], SpawnedProcess | None] | None:
+        if (
+            self.is_defined(cmd)
+            or (cmd in self.command_lib and cmd not in self.natives)
+            or not (file_path := find_which_path(cmd))
+        ):
+            return None
+
+        # Kernel Connects the Pipe Ends, No Bytes Pass Through Python
+        def spawner(
+            args: list[str], process_group: int | None = None
+        ) -> SpawnedProcess | None:
+            context.flush()
+            try:
+                with TRACER.span("spawn", command=cmd):
+                    return spawn(
+                        file_path,
+                        [cmd, *args],
+                        stdin=context.input_file,
+                        stdout=context.output_file,
+                        stderr=context.error_file,
+                        process_group=process_group,
+                    )
+            except OSError as e:
+                self._write_now(context.error_file, f"{cmd}: {e.strerror}")
+                return None
+
+        return spawner
 
     # Command Not Found Case
     def not_found(
         self, context: Redirection, user_input: str
     ) -> Callable[[list[str]], CommandResult]:
         return lambda _: PipeCommandResult(
-            context, stderr=[f"{user_input}: command not found"]
+            context,
+            stderr=[f"{user_input}: command not found"],
+            status=ExitStatus.NOTFOUND.value,
         )
 
     # exit Command case
-    def handle_exit(self, context: Redirection, _) -> CommandResult:
-        os._exit(ExitStatus.FORCEEXIT.value)
+    def handle_exit(self, context: Redirection, args: list[str]) -> CommandResult:
+        # Explicit Status Ends Scripts With It, Bare exit Still Forces the Whole Shell Down
+        sys.stdout.flush()
+        sys.stderr.flush()
+        if not args:
+            raise ForceExit()
+        if EXIT_STATUS_PATTERN.fullmatch(args[0]):
+            status = int(args[0]) & 0xFF
+        else:
+            self._write_now(context.error_file, f"exit: {args[0]}: numeric argument required")
+            status = ExitStatus.SYNTAX.value
+        # Unwinds Instead of os._exit so Profiles and Traces Get Written, Subshells Catch it
+        sys.exit(status)
         return PipeCommandResult(context)
 
     # echo Command Case
@@ -70,20 +247,447 @@ class CommandLibrary:
 
     # type Command Case
     def handle_type(self, context: Redirection, args: list[str]) -> CommandResult:
-        result = []
+        all_matches = bool(args) and args[0] == "-a"
+        if all_matches:
+            args = args[1:]
+
+        # Resolve Every Non-Builtin Argument in One Pass Over PATH
+        found = COMMAND_HASH.find_all(
+            [arg for arg in args if arg not in self.command_lib], all_matches
+        )
+        result, status = [], 0
         for arg in args:
-            # Argument is Actual Command
+            # Each Kind Found is Described in Lookup Order, -a Keeps Going Past the First
+            described = []
+            if arg in self.aliases:
+                described.append([f"{arg} is aliased to `{self.aliases[arg][0]}'"])
+            if arg in self.functions:
+                described.append([f"{arg} is a function", self.functions[arg].text])
             if arg in self.command_lib:
-                result.append(f"{arg} is a shell builtin")
-                continue
+                described.append([f"{arg} is a shell builtin"])
+            described += [[f"{arg} is {file_path}"] for file_path in found.get(arg, [])]
 
-            found_file_path = find_which_path(arg)
-            if found_file_path:
-                result.append(f"{arg} is {found_file_path}")
-            else:
+            if not described:
                 result.append(f"{arg} not found")
+                status = 1
+            for lines in described if all_matches else described[:1]:
+                result.extend(lines)
+        return PipeCommandResult(context, stdout=result, status=status)
+
+    # which Command Case
+    def handle_which(self, context: Redirection, args: list[str]) -> CommandResult:
+        all_matches = bool(args) and args[0] == "-a"
+        if all_matches:
+            args = args[1:]
+
+        found = COMMAND_HASH.find_all(args, all_matches)
+        return PipeCommandResult(
+            context,
+            stdout=[file_path for arg in args for file_path in found[arg]],
+            status=int(not all(found.values())),
+        )
+
+    # hash Command Case
+    def handle_hash(self, context: Redirection, args: list[str]) -> CommandResult:
+        if not args:
+            entries = COMMAND_HASH.entries()
+            if not entries:
+                return PipeCommandResult(context, stdout=["hash: hash table empty"])
+            return PipeCommandResult(
+                context,
+                stdout=["hits\tcommand"]
+                + [f"{hits:>4}\t{file_path}" for _, file_path, hits in entries],
+            )
+
+        flag, *operands = args
+        match flag:
+            case "-r":
+                COMMAND_HASH.clear()
+                return PipeCommandResult(context)
+
+            case "-l":
+                return PipeCommandResult(
+                    context,
+                    stdout=[
+                        f"builtin hash -p {file_path} {name}"
+                        for name, file_path, _ in COMMAND_HASH.entries()
+                    ],
+                )
+
+            case "-p":
+                if len(operands) < 2:
+                    return PipeCommandResult(
+                        context, stderr=["hash: -p: usage: hash -p pathname name"]
+                    )
+                file_path, *names = operands
+                for name in names:
+                    COMMAND_HASH.pin(name, file_path)
+                return PipeCommandResult(context)
+
+            case "-d":
+                errors = [
+                    f"hash: {name}: not found"
+                    for name in operands
+                    if not COMMAND_HASH.forget(name)
+                ]
+                return PipeCommandResult(context, stderr=errors)
+
+            case "-t":
+                result, errors = [], []
+                for name in operands:
+                    if file_path := COMMAND_HASH.find_cached(name):
+                        result.append(file_path)
+                    else:
+                        errors.append(f"hash: {name}: not found")
+                return PipeCommandResult(context, stdout=result, stderr=errors)
+
+        # Remember Each Named Command, Builtins are Silently Skipped
+        errors = [
+            f"hash: {name}: not found"
+            for name in args
+            if name not in self.command_lib and not COMMAND_HASH.learn(name)
+        ]
+        return PipeCommandResult(context, stderr=errors)
+
+    # jobs Command Case
+    def handle_jobs(self, context: Redirection, args: list[str]) -> CommandResult:
+        self.jobs.refresh()
+        markers = self.jobs.markers()
+        result = []
+        for job_id, marker in markers.items():
+            job = self.jobs.jobs[job_id]
+            result.append(f"{job.pgid}" if args == ["-p"] else job.describe(marker))
+            if job.done:
+                self.jobs.remove(job)
         return PipeCommandResult(context, stdout=result)
 
+    # fg Command Case
+    def handle_fg(self, context: Redirection, args: list[str]) -> CommandResult:
+        spec = args[0] if args else None
+        if not (job := self.jobs.find(spec)):
+            return PipeCommandResult(
+                context, stderr=[f"fg: {spec or 'current'}: no such job"]
+            )
+
+        self._write_now(context.output_file, job.command)
+        if self.jobs.foreground(job):
+            # Forced Exit From Inside the Job Ends its Remaining Children and the Shell
+            job.signal(signal.SIGTERM)
+            sys.exit()
+        if job.stopped:
+            return PipeCommandResult(context, stdout=["", job.describe("+")])
+        return PipeCommandResult(context)
+
+    # bg Command Case
+    def handle_bg(self, context: Redirection, args: list[str]) -> CommandResult:
+        spec = args[0] if args else None
+        if not (job := self.jobs.find(spec)):
+            return PipeCommandResult(
+                context, stderr=[f"bg: {spec or 'current'}: no such job"]
+            )
+        if job.state == JobState.RUNNING:
+            return PipeCommandResult(
+                context, stderr=[f"bg: job {job.job_id} already in background"]
+            )
+
+        self.jobs.background(job)
+        return PipeCommandResult(context, stdout=[f"[{job.job_id}]+ {job.command} &"])
+
+    # wait Command Case
+    def handle_wait(self, context: Redirection, args: list[str]) -> CommandResult:
+        jobs, errors = [], []
+        for spec in args:
+            if job := self.jobs.find(spec):
+                jobs.append(job)
+            else:
+                errors.append(f"wait: {spec}: no such job")
+        if not args:
+            jobs = list(self.jobs.jobs.values())
+
+        try:
+            self.jobs.wait(jobs)
+        except KeyboardInterrupt:
+            return PipeCommandResult(context, stderr=errors)
+        for job in jobs:
+            self.jobs.remove(job)
+        return PipeCommandResult(context, stderr=errors)
+
+    # set Command Case
+    def handle_set(self, context: Redirection, args: list[str]) -> CommandResult:
+        if args in ([], ["-o"], ["+o"]):
+            return PipeCommandResult(
+                context,
+                stdout=[
+                    f"{name:<15}\t{'on' if enabled() else 'off'}"
+                    for name, enabled in SHELL_OPTIONS.items()
+                ],
+            )
+
+        flag, *names = args
+        if flag not in ("-o", "+o") or not names:
+            return PipeCommandResult(
+                context, stderr=["set: usage: set [-o|+o] option-name"]
+            )
+
+        errors = []
+        for name in names:
+            if name not in SHELL_OPTIONS:
+                errors.append(f"set: {name}: invalid option name")
+            elif flag == "-o":
+                TRACER.enable()
+            else:
+                # Turning Tracing Off Writes Out What Was Recorded While it Was On
+                TRACER.disable()
+                try:
+                    TRACER.dump()
+                except OSError as e:
+                    errors.append(f"set: {e.filename}: {e.strerror}")
+        return PipeCommandResult(context, stderr=errors)
+
+    # enable Command Case
+    def handle_enable(self, context: Redirection, args: list[str]) -> CommandResult:
+        disable = bool(args) and args[0] == "-n"
+        names = args[1:] if disable else args
+        if not names:
+            return PipeCommandResult(
+                context,
+                stdout=[
+                    f"enable {name}" if name in self.natives else f"enable -n {name}"
+                    for name in NATIVES
+                ],
+            )
+
+        errors = [f"enable: {name}: not a shell builtin" for name in names if name not in NATIVES]
+        chosen = {name for name in names if name in NATIVES}
+        self.set_natives(self.natives - chosen if disable else self.natives | chosen)
+        return PipeCommandResult(context, stderr=errors, status=int(bool(errors)))
+
+    # alias Command Case, Each Value is Parsed Once Here and Never Tokenized Again
+    def handle_alias(self, context: Redirection, args: list[str]) -> CommandResult:
+        if not args:
+            return PipeCommandResult(
+                context,
+                stdout=[
+                    f"alias {name}={quote_alias(text)}"
+                    for name, (text, _) in sorted(self.aliases.items())
+                ],
+            )
+
+        result, errors = [], []
+        for arg in args:
+            name, assigns, text = arg.partition("=")
+            if not assigns:
+                if name in self.aliases:
+                    result.append(f"alias {name}={quote_alias(self.aliases[name][0])}")
+                else:
+                    errors.append(f"alias: {name}: not found")
+                continue
+
+            if not ALIAS_NAME.fullmatch(name):
+                errors.append(f"alias: `{name}': invalid alias name")
+                continue
+            try:
+                body = parse(text)
+            except ParseError as e:
+                errors.append(f"alias: {name}: {e}")
+                continue
+            if body is None:
+                errors.append(f"alias: {name}: empty alias")
+                continue
+            self.aliases[name] = (text, body)
+        return PipeCommandResult(
+            context, stdout=result, stderr=errors, status=int(bool(errors))
+        )
+
+    # unalias Command Case
+    def handle_unalias(self, context: Redirection, args: list[str]) -> CommandResult:
+        if args == ["-a"]:
+            self.aliases.clear()
+            return PipeCommandResult(context)
+        if not args:
+            return PipeCommandResult(
+                context, stderr=["unalias: usage: unalias [-a] name [name ...]"], status=2
+            )
+
+        errors = [
+            f"unalias: {name}: not found"
+            for name in args
+            if self.aliases.pop(name, None) is None
+        ]
+        return PipeCommandResult(context, stderr=errors, status=int(bool(errors)))
+
+    # Alias or Function Case, the Body is Already Parsed so Calling Only Expands its Words
+    def handle_defined(
+        self, context: Redirection, cmd: str
+    ) -> Callable[[list[str]], CommandResult]:
+        is_alias = cmd in self.aliases and cmd not in self._expanding
+
+        def handler(args: list[str]) -> CommandResult:
+            context.flush()
+            try:
+                if is_alias:
+                    # Arguments Follow the Alias Text, Exactly as Though Typed After It
+                    self._expanding.add(cmd)
+                    try:
+                        status = self.call(
+                            with_arguments(self.aliases[cmd][1], args), context, None
+                        )
+                    finally:
+                        self._expanding.discard(cmd)
+                else:
+                    status = self.call(self.functions[cmd].body, context, args)
+            except RecursionError:
+                return PipeCommandResult(
+                    context,
+                    stderr=[f"{cmd}: maximum function nesting level exceeded"],
+                    status=1,
+                )
+            return PipeCommandResult(context, status=status)
+
+        return handler
+
+    # parallel Command Case
+    def handle_parallel(self, context: Redirection, args: list[str]) -> CommandResult:
+        workers = default_workers()
+        if args[:1] == ["-j"]:
+            if len(args) < 2 or not args[1].isdigit() or int(args[1]) < 1:
+                context.close_input()
+                return PipeCommandResult(
+                    context, stderr=["parallel: usage: parallel [-j jobs] [command ...]"]
+                )
+            workers, args = int(args[1]), args[2:]
+
+        # Without Operands Each Non-Blank Line Piped In is a Command
+        lines = args
+        if not lines and context.input_file is not None:
+            lines = [line.strip() for line in context.input_file if line.strip()]
+        context.close_input()
+        if not lines:
+            return PipeCommandResult(context)
+
+        # Each Line's Output is Written Whole Once it and Every Line Before it Have Finished
+        failed = 0
+        try:
+            for status, stdout, stderr in run_parallel(lines, workers):
+                failed += status != 0
+                context.output_file.write(stdout.decode(errors="replace"))
+                context.output_file.flush()
+                context.error_file.write(stderr.decode(errors="replace"))
+                context.error_file.flush()
+        except KeyboardInterrupt:
+            return PipeCommandResult(context, status=128 + signal.SIGINT)
+        return PipeCommandResult(context, status=min(failed, PARALLEL_FAILURE_CAP))
+
+    # cached Command Case, a Hit Replays the Stored Output Without Spawning Anything
+    def handle_cached(self, context: Redirection, args: list[str]) -> CommandResult:
+        # Input Read From a Pipe or File Cannot be Part of the Key
+        has_input = context.input_file is not None
+        context.close_input()
+        try:
+            options = CacheOptions(args)
+        except ValueError as e:
+            return PipeCommandResult(context, stderr=[str(e)], status=ExitStatus.SYNTAX.value)
+        if has_input:
+            return PipeCommandResult(
+                context,
+                stderr=["cached: standard input cannot be cached, name files with --input"],
+                status=ExitStatus.SYNTAX.value,
+            )
+
+        cmd = options.argv[0]
+        if not (file_path := find_which_path(cmd)):
+            return PipeCommandResult(
+                context,
+                stderr=[f"{cmd}: command not found"],
+                status=ExitStatus.NOTFOUND.value,
+            )
+
+        key = OUTPUT_CACHE.key(file_path, options)
+        if (entry := OUTPUT_CACHE.lookup(key, options.ttl)) is None:
+            try:
+                with TRACER.span("spawn", command=cmd):
+                    entry = capture(file_path, options.argv)
+            except OSError as e:
+                return self.exec_failed(context, cmd, e)
+            except KeyboardInterrupt:
+                return PipeCommandResult(context, status=128 + signal.SIGINT)
+            OUTPUT_CACHE.store(key, *entry)
+
+        status, stdout, stderr = entry
+        return CapturedCommandResult(context, stdout, stderr, status)
+
+    # cache Command Case
+    def handle_cache(self, context: Redirection, args: list[str]) -> CommandResult:
+        match args:
+            case ["stats"]:
+                entries, size = OUTPUT_CACHE.usage()
+                return PipeCommandResult(
+                    context,
+                    stdout=[
+                        f"{name:<10}{value}"
+                        for name, value in (
+                            ("directory", OUTPUT_CACHE.directory),
+                            ("entries", entries),
+                            ("bytes", size),
+                            ("limit", OUTPUT_CACHE.limit),
+                            ("hits", OUTPUT_CACHE.hits),
+                            ("misses", OUTPUT_CACHE.misses),
+                            ("expired", OUTPUT_CACHE.expired),
+                            ("stores", OUTPUT_CACHE.stores),
+                            ("evictions", OUTPUT_CACHE.evictions),
+                        )
+                    ],
+                )
+            case ["clear"]:
+                OUTPUT_CACHE.clear()
+                return PipeCommandResult(context)
+        return PipeCommandResult(
+            context,
+            stderr=["cache: usage: cache stats | cache clear"],
+            status=ExitStatus.SYNTAX.value,
+        )
+
+    # times Command Case, the Shell's Own CPU Time Then That of Every Child it Reaped
+    def handle_times(self, context: Redirection, _) -> CommandResult:
+        shell, children = os.times(), usage.SESSION_USAGE
+        return PipeCommandResult(
+            context,
+            stdout=[
+                f"{usage.format_seconds(shell.user)} {usage.format_seconds(shell.system)}",
+                f"{usage.format_seconds(children.user)} {usage.format_seconds(children.system)}",
+                f"maxrss {children.maxrss}k",
+            ],
+        )
+
+    # history Command Case
+    def handle_history(self, context: Redirection, args: list[str]) -> CommandResult:
+        if self.history is None:
+            return PipeCommandResult(context)
+
+        # Matches are Listed Oldest First so the Most Recent Ends Up Next to the Prompt
+        if args and args[0] == "-f":
+            if len(args) < 2:
+                return PipeCommandResult(
+                    context, stderr=["history: -f: usage: history -f text"]
+                )
+            entries = self.history.search(" ".join(args[1:]))[::-1]
+        elif not args:
+            entries = self.history.entries()
+        elif args[0].isdigit():
+            entries = self.history.entries(int(args[0]))
+        else:
+            return PipeCommandResult(
+                context, stderr=[f"history: {args[0]}: numeric argument required"]
+            )
+        return PipeCommandResult(
+            context, stdout=[f"{number:>5}  {entry}" for number, entry in entries]
+        )
+
+    # Writes a Line Right Away, Ahead of Anything a Child or Result Writes Later
+    def _write_now(self, file: TextIO, line: str) -> None:
+        file.write(f"{line}\n")
+        file.flush()
+
     # pwd Case
     def handle_pwd(self, context: Redirection, _) -> CommandResult:
         return PipeCommandResult(context, stdout=[os.getcwd()])
@@ -104,29 +708,78 @@ class CommandLibrary:
             context, stderr=[f"cd: {path_input}: No such file or directory"]
         )
 
+    # Native Utility Case, Reads and Writes the Section's Descriptors Directly
+    def handle_native(
+        self, context: Redirection, cmd: str, user_input: str
+    ) -> Callable[[list[str]], CommandResult]:
+        native = self.command_lib[cmd]
+
+        def handler(args: list[str]) -> CommandResult:
+            stdin_fd = None if context.input_file is None else context.input_file.fileno()
+            context.flush()
+            try:
+                with TRACER.span("native", command=cmd):
+                    status, errors = self._run_native(native, args, stdin_fd, context.output_file)
+            except Unsupported:
+                # Flags or a Terminal stdin the Native Does Not Handle Go to the Real Binary
+                return self.find_external(context, cmd, user_input)(args)
+            except BrokenPipeError:
+                return PipeCommandResult(context, status=128 + signal.SIGPIPE)
+            finally:
+                context.close_input()
+            return PipeCommandResult(context, stderr=errors, status=status)
+
+        return handler
+
+    # Output Without a Descriptor, Such as a Buffered Pipe Section, is Collected in a Temporary File
+    def _run_native(
+        self, native: Callable, args: list[str], stdin_fd: int | None, output: TextIO
+    ) -> tuple[int, list[str]]:
+        try:
+            return native(args, stdin_fd, output.fileno())
+        except io.UnsupportedOperation:
+            pass
+        with tempfile.TemporaryFile() as buffer:
+            result = native(args, stdin_fd, buffer.fileno())
+            buffer.seek(0)
+            output.write(buffer.read().decode(errors="replace"))
+        return result
+
     # Custom Or Not Found Exec Case
     def handle_custom_exec_pipe(
-        self, context: Redirection, cmd: str
+        self, context: Redirection, cmd: str, file_path: str
     ) -> Callable[[list[str]], CommandResult]:
 
         global TEST_NUM
         # print(f"{TEST_NUM}: {context.input_file}")
         TEST_NUM += 1
 
-        # Redirection to different file case, Use different pipes for output and error stream of process
+        # Redirection to different file case, Only Terminal Bound Streams are Relayed Through Pipes
         def handler(args: list[str]) -> CommandResult:
-            process = subprocess.Popen(
-                [cmd, *args],
-                stdin=context.input_file,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1,
-            )
+            context.flush()
+            try:
+                with TRACER.span("spawn", command=cmd):
+                    process = spawn(
+                        file_path,
+                        [cmd, *args],
+                        stdin=context.input_file,
+                        stdout=(
+                            PIPE
+                            if self.interactive and is_terminal(context.output_file)
+                            else context.output_file
+                        ),
+                        stderr=(
+                            PIPE
+                            if self.interactive and is_terminal(context.error_file)
+                            else context.error_file
+                        ),
+                    )
+            except OSError as e:
+                return self.exec_failed(context, cmd, e)
             return PipeCommandResult(
                 context,
-                stdout=process.stdout,
-                stderr=process.stderr,
+                stdout=process.stdout or [],
+                stderr=process.stderr or [],
                 process=process,
                 flush=True,
             )
@@ -135,26 +788,34 @@ class CommandLibrary:
 
     # Custom Or Not Found Exec Case
     def handle_custom_exec_pty(
-        self, context: Redirection, cmd: str
+        self, context: Redirection, cmd: str, file_path: str
     ) -> Callable[[list[str]], CommandResult]:
 
         # Default Sys.stdout & Sys.stderr case, Use Master/Slave Processes
         def handler(args: list[str]) -> CommandResult:
-            # Generates Master/Slave Pair, redirecting child process stdin, stdout, stderr to Slave PTY
-            pid, master_fd = os.forkpty()
-            if pid == 0:
-                try:
-                    # Child Process set terminal type
-                    os.environ["TERM"] = DEFAULT_TERM
+            # Child Gets the Slave PTY as stdin, stdout, stderr and Runs the Already Resolved Command
+            try:
+                with TRACER.span("spawn", command=cmd):
+                    pid, master_fd = spawn_pty(
+                        file_path, [cmd, *args], {**os.environ, "TERM": DEFAULT_TERM}
+                    )
+            except OSError as e:
+                return self.exec_failed(context, cmd, e)
+            return PTYCommandResult(context, master_fd, pid, flush=True)
 
-                    # Child Process executes command, replacing Current Process
-                    os.execvp(cmd, [cmd, *args])
+        return handler
 
-                except Exception as e:
-                    sys.stderr.write(f"Failed to exec: {e}\n")
-                    os._exit(1)
+    # Found on PATH but the Kernel Refused to Run it, Such as a Script Without a #! Line
+    def exec_failed(
+        self, context: Redirection, cmd: str, error: OSError
+    ) -> CommandResult:
+        return PipeCommandResult(
+            context,
+            stderr=[f"{cmd}: {error.strerror}"],
+            status=ExitStatus.NOEXEC.value,
+        )
 
-            else:
-                return PTYCommandResult(context, master_fd, pid, flush=True)
 
-        return handler
+# Single Quotes Written Back So the Listing Can be Pasted as a Command
+def quote_alias(text: str) -> str:
+    return "'" + text.replace("'", "'\\''") + "'"
@@ -1,11 +1,17 @@
-import sys, os, threading, termios, io, tty, select, gc, subprocess
-from app.utils import Redirection
+import sys, os, threading, termios, io, tty, signal, selectors
+from app.utils import Redirection, is_terminal
+from app.spawn import SpawnedProcess
+from app.trace import traced
+from app.usage import wait_child
 from typing import Iterable, TextIO
 from abc import ABC, abstractmethod
 
 
 PAGE_SIZE = 4096
 CHUNK_SIZE = 1024
+MAX_CHUNK_SIZE = 65536
+DRAIN_CHUNK_SIZE = 65536
+DRAIN_BUFFER_SIZE = 65536
 
 
 class CommandResult(ABC):
@@ -13,6 +19,7 @@ class CommandResult(ABC):
 
     def __init__(self, context: Redirection, flush: bool = False):
         self.context = context
+        self.status = 0
         self._write = self._write_and_flush if flush else self._write_only
 
     def _write_only(self, target: TextIO, data: str) -> None:
@@ -36,39 +43,135 @@ class PipeCommandResult(CommandResult):
     def __init__(
         self,
         context: Redirection,
-        stdout: Iterable[str] | io.TextIOWrapper = [],
-        stderr: Iterable[str] | io.TextIOWrapper = [],
-        process: subprocess.Popen | None = None,
+        stdout: Iterable[str] | io.RawIOBase = [],
+        stderr: Iterable[str] | io.RawIOBase = [],
+        process: SpawnedProcess | None = None,
         flush: bool = False,
+        status: int | None = None,
     ) -> None:
         super().__init__(context, flush)
-        self.stdout = stdout
-        self.stderr = stderr
+        # Builtins Fail With 1 Once They Report an Error Unless Told Otherwise
+        if status is None:
+            status = 1 if isinstance(stderr, list) and stderr else 0
+        self.status = status
+        # Builtins Hand Over Lists of Lines Without Their Line Endings
+        self.stdout = [f"{line}\n" for line in stdout] if isinstance(stdout, list) else stdout
+        self.stderr = [f"{line}\n" for line in stderr] if isinstance(stderr, list) else stderr
         self.process = process
 
+    @traced("PipeCommandResult._consume")
     def _consume(self) -> None:
-        def drain(input: Iterable[str], file: TextIO, tester: str = "") -> None:
-            last_chunk = ""
-            for data in input:
-                if data:
-                    self._write(file, data)
-                    last_chunk = data
-            if last_chunk and not last_chunk.endswith("\n"):
-                self._write(file, "\n")
-
-        err_thread = threading.Thread(
-            target=drain, args=(self.stderr, self.context.error_file)
-        )
-        err_thread.start()
-        drain(self.stdout, self.context.output_file)
-
-        # 3. Cleanup
-        err_thread.join()
-        del err_thread
         if self.process:
-            self.process.wait()
-            self.stdout.close()
-            self.stderr.close()
+            self._drain_process()
+            return
+
+        # Builtin Output is Already in Memory, Write Each Stream Out in One Call
+        for lines, file in (
+            (self.stdout, self.context.output_file),
+            (self.stderr, self.context.error_file),
+        ):
+            data = "".join(lines)
+            if data:
+                self._write(file, data if data.endswith("\n") else f"{data}\n")
+
+    # Multiplexes Both Process Streams on One Selector, Reading Raw Bytes in Large Chunks
+    def _drain_process(self) -> None:
+        selector = selectors.DefaultSelector()
+        for stream, file in (
+            (self.process.stdout, self.context.output_file),
+            (self.process.stderr, self.context.error_file),
+        ):
+            if stream:
+                selector.register(stream, selectors.EVENT_READ, OutputBuffer(file))
+
+        try:
+            while selector.get_map():
+                for key, _ in selector.select():
+                    if data := os.read(key.fd, DRAIN_CHUNK_SIZE):
+                        key.data.feed(data)
+                    else:
+                        key.data.finish()
+                        selector.unregister(key.fileobj)
+        finally:
+            selector.close()
+            self.status = self.process.wait()
+            for stream in (self.process.stdout, self.process.stderr):
+                if stream:
+                    stream.close()
+
+
+# Coalesces Raw Output Up to a Bounded Size Before Writing it to the Target Descriptor
+class OutputBuffer:
+    def __init__(self, target: TextIO, limit: int = DRAIN_BUFFER_SIZE) -> None:
+        self.fd = raw_fd(target)
+        self.limit = limit
+        self.line_flush = is_terminal(target)
+        self.pending = bytearray()
+        self.last_byte = b""
+
+    def feed(self, data: bytes) -> None:
+        self.pending += data
+        self.last_byte = data[-1:]
+        if len(self.pending) >= self.limit:
+            self._flush(len(self.pending))
+        # Terminals See Every Complete Line as Soon as it Arrives
+        elif self.line_flush and (end := self.pending.rfind(b"\n") + 1):
+            self._flush(end)
+
+    # Stream Ended, Append the Missing Trailing Newline and Write Everything Left
+    def finish(self) -> None:
+        if self.last_byte and self.last_byte != b"\n":
+            self.pending += b"\n"
+        self._flush(len(self.pending))
+
+    def _flush(self, end: int) -> None:
+        if end:
+            write_all(self.fd, self.pending, end)
+            del self.pending[:end]
+
+
+# Output Captured Earlier, Written Out Byte for Byte so a Replay Matches the Original Run
+class CapturedCommandResult(CommandResult):
+    def __init__(
+        self, context: Redirection, stdout: bytes, stderr: bytes, status: int
+    ) -> None:
+        super().__init__(context)
+        self.status = status
+        self.stdout = stdout
+        self.stderr = stderr
+
+    def _consume(self) -> None:
+        for data, file in (
+            (self.stdout, self.context.output_file),
+            (self.stderr, self.context.error_file),
+        ):
+            if not data:
+                continue
+            with self._write_lock:
+                try:
+                    fd = raw_fd(file)
+                except (AttributeError, io.UnsupportedOperation):
+                    # In Memory Targets Take the Bytes Through Their Binary Buffer if They Have One
+                    if (binary := getattr(file, "buffer", None)) is not None:
+                        binary.write(data)
+                    else:
+                        file.write(data.decode(errors="replace"))
+                    continue
+                write_all(fd, data, len(data))
+
+
+# Pending Text Must Land Before Bytes are Written Underneath It
+def raw_fd(target: TextIO) -> int:
+    target.flush()
+    return target.fileno()
+
+
+def write_all(fd: int, data: bytes | bytearray, end: int) -> None:
+    with memoryview(data) as view:
+        chunk = view[:end]
+        while chunk:
+            chunk = chunk[os.write(fd, chunk) :]
+        chunk.release()
 
 
 class PTYCommandResult(CommandResult):
@@ -78,6 +181,7 @@ class PTYCommandResult(CommandResult):
         super().__init__(context, flush)
         self.master_fd = master_fd
         self.pid = pid
+        self.wait_status = None
         self._write = self._write_binary
 
     def _write_binary(self, target: TextIO, data: bytes) -> None:
@@ -85,50 +189,105 @@ class PTYCommandResult(CommandResult):
             target.buffer.write(data)
             target.flush()
 
-    # Reads Master FD and Writes to Screen Terminal
+    # Single Loop Relaying Keyboard Input, Child Output and Signals Through One Selector
     def _consume(self) -> None:
-        last_chunk = ""
+        stdin_fd = sys.stdin.fileno()
+        selector = selectors.DefaultSelector()
+        selector.register(self.master_fd, selectors.EVENT_READ)
+        selector.register(self.wakeup_fd, selectors.EVENT_READ)
+        if self.interactive:
+            selector.register(stdin_fd, selectors.EVENT_READ)
+
+        chunk_size = CHUNK_SIZE
         try:
-            while data := os.read(self.master_fd, CHUNK_SIZE):
-                self._write(self.context.output_file, data)
-        except OSError:
-            pass
+            while True:
+                for key, _ in selector.select():
+                    if key.fd == self.master_fd:
+                        data = self._read_master(chunk_size)
+                        if not data:
+                            return
+                        self._write(self.context.output_file, data)
+
+                        # Grow Reads While Output Keeps Filling Them, Shrink Back When Idle
+                        if len(data) == chunk_size:
+                            chunk_size = min(chunk_size * 2, MAX_CHUNK_SIZE)
+                        elif len(data) < chunk_size // 4:
+                            chunk_size = max(chunk_size // 2, CHUNK_SIZE)
+
+                    elif key.fd == stdin_fd:
+                        # Sends Keyboard data to Master FD
+                        if data := os.read(stdin_fd, CHUNK_SIZE):
+                            os.write(self.master_fd, data)
+                        else:
+                            selector.unregister(stdin_fd)
+
+                    elif self._handle_signals():
+                        # Child Exited, Flush Whatever it Left Behind Without Blocking
+                        os.set_blocking(self.master_fd, False)
+                        while data := self._read_master(MAX_CHUNK_SIZE):
+                            self._write(self.context.output_file, data)
+                        return
         finally:
-            if last_chunk and not last_chunk.endswith("\n"):
-                self._write(self.context.output_file, "\n")
+            selector.close()
             os.close(self.master_fd)
-            self.child_end.set()
-
-    # Forwards User Keyboard Inputs To Master FD
-    def _forward(self) -> None:
-        # Checks if Child Process Running Command Still Exists
-        read_list = [sys.stdin.fileno()]
-        empty_list = []
-        while not self.child_end.is_set():
-            # Checks if Stdin has been written to by Keyboard
-            r, _, _ = select.select(read_list, empty_list, empty_list, 0.1)
-            if r:
-                data = os.read(sys.stdin.fileno(), CHUNK_SIZE)
-                if not data:
-                    break
-
-                # Sends Keyboard data to Master FD
-                os.write(self.master_fd, data)
 
+    def _read_master(self, size: int) -> bytes:
+        # Linux Raises EIO Once the Slave Side is Closed
+        try:
+            return os.read(self.master_fd, size)
+        except (BlockingIOError, OSError):
+            return b""
+
+    # Returns True Once the Child Process has Exited
+    def _handle_signals(self) -> bool:
+        exited = False
+        for signum in os.read(self.wakeup_fd, PAGE_SIZE):
+            if signum == signal.SIGWINCH:
+                self._resize()
+            elif signum == signal.SIGCHLD and self.wait_status is None:
+                pid, wait_status = wait_child(self.pid, os.WNOHANG)
+                if pid:
+                    self.wait_status = wait_status
+                    exited = True
+        return exited
+
+    # Copies the Terminal Window Size onto the Child PTY, Kernel Delivers SIGWINCH to It
+    def _resize(self) -> None:
+        try:
+            termios.tcsetwinsize(
+                self.master_fd, termios.tcgetwinsize(sys.stdin.fileno())
+            )
+        except (OSError, termios.error):
+            pass
+
+    @traced("PTYCommandResult.output")
     def output(self) -> None:
-        old_configs = termios.tcgetattr(sys.stdin.fileno())
-        self.child_end = threading.Event()
+        stdin_fd = sys.stdin.fileno()
+        self.interactive = os.isatty(stdin_fd)
+        old_configs = termios.tcgetattr(stdin_fd) if self.interactive else None
+
+        # Signals Wake the Selector Through a Self Pipe Instead of Polling
+        self.wakeup_fd, wakeup_write = os.pipe()
+        os.set_blocking(wakeup_write, False)
+        old_wakeup = signal.set_wakeup_fd(wakeup_write)
+        old_handlers = {
+            signum: signal.signal(signum, lambda *_: None)
+            for signum in (signal.SIGCHLD, signal.SIGWINCH)
+        }
         try:
-            tty.setraw(sys.stdin.fileno())
-            keyinput_thread = threading.Thread(target=self._forward)
-            keyinput_thread.start()
+            if self.interactive:
+                tty.setraw(stdin_fd)
+                self._resize()
             self._consume()
 
         finally:
-            self.child_end.set()
-            keyinput_thread.join()
-            os.waitpid(self.pid, 0)
-            termios.tcsetattr(sys.stdin.fileno(), termios.TCSADRAIN, old_configs)
-            # Garbage Collect Lists Generated from Select in Keyboard Checking Loop
-            gc.collect()
-            del keyinput_thread
+            for signum, handler in old_handlers.items():
+                signal.signal(signum, handler)
+            signal.set_wakeup_fd(old_wakeup)
+            os.close(self.wakeup_fd)
+            os.close(wakeup_write)
+            if self.wait_status is None:
+                _, self.wait_status = wait_child(self.pid)
+            self.status = os.waitstatus_to_exitcode(self.wait_status)
+            if old_configs:
+                termios.tcsetattr(stdin_fd, termios.TCSADRAIN, old_configs)
@@ -0,0 +1,171 @@
+import os, threading
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Callable, Iterable
+
+
+# Directories Whose Listings are Kept, Least Recently Completed Ones are Dropped First
+PATH_CACHE_SIZE = 64
+
+
+# Sorted Name Arrays Where Every Prefix Maps to One Contiguous Slice
+class CompletionIndex:
+    def __init__(self, names: Iterable[str] = ()) -> None:
+        self._names = sorted(set(names))
+        self._folded_keys: list[str] | None = None
+        self._folded_names: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, name: str) -> bool:
+        i = bisect_left(self._names, name)
+        return i < len(self._names) and self._names[i] == name
+
+    # Returns Every Name Starting With Prefix, in Sorted Order
+    def prefix(self, text: str, ignore_case: bool = False) -> list[str]:
+        if ignore_case:
+            # Case Folded Keys Kept Parallel to Their Original Spellings, Built on First Use
+            if self._folded_keys is None:
+                folded = sorted((name.casefold(), name) for name in self._names)
+                self._folded_keys = [key for key, _ in folded]
+                self._folded_names = [name for _, name in folded]
+            start, end = prefix_range(self._folded_keys, text.casefold())
+            return self._folded_names[start:end]
+        start, end = prefix_range(self._names, text)
+        return self._names[start:end]
+
+    # One Insertion Keeps Both Arrays Sorted, Nothing is Rebuilt
+    def add(self, name: str) -> None:
+        i = bisect_left(self._names, name)
+        if i < len(self._names) and self._names[i] == name:
+            return
+        self._names.insert(i, name)
+        if self._folded_keys is not None:
+            i = self._folded_position(name)
+            self._folded_keys.insert(i, name.casefold())
+            self._folded_names.insert(i, name)
+
+    def discard(self, name: str) -> None:
+        i = bisect_left(self._names, name)
+        if i == len(self._names) or self._names[i] != name:
+            return
+        del self._names[i]
+        if self._folded_keys is not None:
+            i = self._folded_position(name)
+            del self._folded_keys[i]
+            del self._folded_names[i]
+
+    # Names Folding to the Same Key Sit in Their Original Sorted Order
+    def _folded_position(self, name: str) -> int:
+        key = name.casefold()
+        i = bisect_left(self._folded_keys, key)
+        while (
+            i < len(self._folded_keys)
+            and self._folded_keys[i] == key
+            and self._folded_names[i] < name
+        ):
+            i += 1
+        return i
+
+
+# Builds an Index on a Background Thread, Callers Block Only if They Need it Before it is Ready
+class BackgroundIndex:
+    def __init__(self, build: Callable[[], CompletionIndex]) -> None:
+        self._index = None
+        self._thread = threading.Thread(target=self._build, args=(build,), daemon=True)
+        self._thread.start()
+
+    def _build(self, build: Callable[[], CompletionIndex]) -> None:
+        self._index = build()
+
+    def ready(self) -> bool:
+        return not self._thread.is_alive()
+
+    def get(self) -> CompletionIndex:
+        self._thread.join()
+        return self._index
+
+    def __len__(self) -> int:
+        return len(self.get())
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.get()
+
+    def prefix(self, text: str, ignore_case: bool = False) -> list[str]:
+        return self.get().prefix(text, ignore_case)
+
+
+# Directory Listings Keyed by Path, Re-Read Only When the Directory's mtime Changes
+class DirectoryCache:
+    def __init__(self, size: int = PATH_CACHE_SIZE) -> None:
+        self.size = size
+        self._listings: OrderedDict[str, tuple[int, CompletionIndex, frozenset[str]]] = (
+            OrderedDict()
+        )
+
+    def listing(self, directory: str) -> tuple[CompletionIndex, frozenset[str]]:
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return CompletionIndex(), frozenset()
+
+        if (cached := self._listings.get(directory, None)) and cached[0] == mtime:
+            self._listings.move_to_end(directory)
+            return cached[1], cached[2]
+
+        # scandir Streams Entries With Their Types, Only Symlinks Cost an Extra stat
+        names, dirs = [], set()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    names.append(entry.name)
+                    try:
+                        if entry.is_dir():
+                            dirs.add(entry.name)
+                    except OSError:
+                        pass
+        except OSError:
+            return CompletionIndex(), frozenset()
+
+        self._listings[directory] = (mtime, CompletionIndex(names), frozenset(dirs))
+        self._listings.move_to_end(directory)
+        if len(self._listings) > self.size:
+            self._listings.popitem(last=False)
+        return self._listings[directory][1], self._listings[directory][2]
+
+    # Completes a Path Word, Directories Come Back With a Trailing Slash
+    def complete(self, word: str, ignore_case: bool = False) -> list[str]:
+        head, separator, prefix = word.rpartition("/")
+        directory = os.path.expanduser(f"{head}{separator}") or "."
+        index, dirs = self.listing(directory)
+
+        # Hidden Entries Only Show Up Once the Prefix Asks for Them
+        matches = index.prefix(prefix, ignore_case)
+        if not prefix.startswith("."):
+            matches = [name for name in matches if not name.startswith(".")]
+        return [
+            f"{head}{separator}{name}/" if name in dirs else f"{head}{separator}{name}"
+            for name in matches
+        ]
+
+
+# Directories Stay Open for the Next Component, Files End the Word
+def finish_path(path: str) -> str:
+    return path if path.endswith("/") else f"{path} "
+
+
+# Arguments Get Paths, the First Word of Each Pipeline Section Gets Commands
+def completes_command(before: str, word: str) -> bool:
+    before = before.rstrip()
+    return "/" not in word and (not before or before[-1] in "|&;")
+
+
+# Bisects the Half Open [start, end) Range of Keys Sharing a Prefix
+def prefix_range(keys: list[str], text: str) -> tuple[int, int]:
+    start = bisect_left(keys, text)
+    if not text:
+        return start, len(keys)
+    # Every Key With This Prefix Sorts Below the Prefix Followed by the Max Code Point
+    end = bisect_left(keys, f"{text}\U0010ffff", start)
+    return start, end
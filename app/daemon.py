@@ -0,0 +1,164 @@
+import os, sys, gc, json, stat, struct, signal, socket, atexit, argparse
+from app.client import SOCKET_ENV, socket_dir, socket_path, make_socket_dir, peer_uid
+from app.cmd_hash import COMMAND_HASH
+from app.expand import positional
+from app.main import build_parser, batch_lines
+from app.parser import ParseError
+from app.shell import PersonalShell
+from app.utils import FORCE_EXIT_STATUS, Commands, ExitStatus, std_isatty
+
+
+# Requests Open With Their Length, Then the JSON Body, With stdin, stdout and stderr Attached
+HEADER = struct.Struct("!I")
+STATUS = struct.Struct("!i")
+MAX_REQUEST_SIZE = 1 << 20
+REQUEST_FDS = 3
+LISTEN_BACKLOG = 128
+
+
+# Keeps One Warm Shell and Forks it per Request, Each Child Starts With Every Import,
+# the Resolved PATH and the Parse Cache Already in Memory
+def serve(path: str | None = None) -> None:
+    if not path and not os.environ.get(SOCKET_ENV):
+        make_socket_dir(socket_dir())
+    path = path or socket_path()
+    shell = PersonalShell(interactive=False)
+    parser = warm()
+
+    # A Socket Left Behind by a Daemon That Died is Replaced, Anything Else is Left Alone
+    try:
+        info = os.lstat(path)
+    except FileNotFoundError:
+        pass
+    else:
+        if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+            raise PermissionError(f"{path}: exists and is not a socket of this user")
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(old_umask)
+    server.listen(LISTEN_BACKLOG)
+    atexit.register(os.unlink, path)
+
+    signal.signal(signal.SIGCHLD, reap)
+    # Unwinds on kill so the Socket File is Removed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    sys.stderr.write(f"personal-shell: serving on {path}\n")
+    sys.stderr.flush()
+    try:
+        while True:
+            connection, _ = server.accept()
+            with connection:
+                # The Socket is 0600 Already, This Also Holds for a Path Given With --socket
+                if peer_uid(connection, path) == os.getuid():
+                    dispatch(shell, parser, connection)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+# Resolves Every Command on PATH Once so Children Never Walk it, and Builds the Argument
+# Parser Up Front Since its First Use Pulls in Lazy Imports That Would Repeat in Every Child
+def warm() -> argparse.ArgumentParser:
+    COMMAND_HASH.find_all(Commands.get_commands())
+    parser = build_parser()
+    parser.parse_args(["-c", ""])
+    # Objects Created So Far are Never Scanned by a Child's Collector, Keeping Their Pages Shared
+    gc.freeze()
+    return parser
+
+
+def dispatch(
+    shell: PersonalShell, parser: argparse.ArgumentParser, connection: socket.socket
+) -> None:
+    try:
+        request, fds = receive_request(connection)
+    except (OSError, ValueError) as e:
+        sys.stderr.write(f"personal-shell: bad request: {e}\n")
+        return
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    try:
+        if os.fork() == 0:
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            status = FORCE_EXIT_STATUS
+            try:
+                status = handle_request(shell, parser, request, fds)
+            finally:
+                # The Status Goes Back Before Exiting, os._exit Skips the Daemon's atexit Hooks
+                try:
+                    connection.sendall(STATUS.pack(status))
+                finally:
+                    os._exit(status & 0xFF)
+    finally:
+        for fd in fds:
+            os.close(fd)
+
+
+def receive_request(connection: socket.socket) -> tuple[dict, list[int]]:
+    data, fds, _, _ = socket.recv_fds(connection, MAX_REQUEST_SIZE, REQUEST_FDS)
+    if len(fds) != REQUEST_FDS or len(data) < HEADER.size:
+        for fd in fds:
+            os.close(fd)
+        raise ValueError("expected a header and three descriptors")
+
+    (length,) = HEADER.unpack_from(data)
+    body = bytearray(data[HEADER.size :])
+    while len(body) < length:
+        if not (chunk := connection.recv(length - len(body))):
+            break
+        body += chunk
+    return json.loads(body), fds
+
+
+# Runs in the Forked Child: Takes on the Client's cwd, Environment and Standard Streams
+def handle_request(
+    shell: PersonalShell, parser: argparse.ArgumentParser, request: dict, fds: list[int]
+) -> int:
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+    # Received Descriptors Would Otherwise Leak Into Every Command the Request Starts
+    for fd in fds:
+        if fd not in range(REQUEST_FDS):
+            os.close(fd)
+    std_isatty.cache_clear()
+    # Only Variables That Differ are Touched, Each Change is a putenv or unsetenv Call
+    env = request["env"]
+    for name in [name for name in os.environ if name not in env]:
+        del os.environ[name]
+    for name, value in env.items():
+        if os.environ.get(name) != value:
+            os.environ[name] = value
+    try:
+        os.chdir(request["cwd"])
+        options = parser.parse_args(request["argv"])
+        if (lines := batch_lines(options)) is None:
+            sys.stderr.write("personal-shell: the daemon cannot run interactive sessions\n")
+            return ExitStatus.SYNTAX.value
+        with positional(options.args):
+            return shell.run_batch(lines, options.parse_all)
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else 0
+    except (OSError, ParseError) as e:
+        sys.stderr.write(f"personal-shell: {e}\n")
+        return 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+# Collects Finished Request Children so None Linger as Zombies
+def reap(*_) -> None:
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if not pid:
+            return
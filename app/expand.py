@@ -0,0 +1,202 @@
+import os, re, fnmatch, functools, contextlib
+from enum import Enum
+from typing import Callable, Iterator
+
+
+# Compiled Matchers Kept for Glob Components, Least Recently Used Dropped First
+PATTERN_CACHE_SIZE = 256
+GLOB_MAGIC = re.compile(r"[*?[]")
+VARIABLE = re.compile(r"\$(?:([A-Za-z_]\w*|[?#@*1-9])|\{([A-Za-z_]\w*|[?#@*]|[1-9]\d*)\})")
+FIELD_SEPARATORS = " \t\n"
+# Arguments of the Innermost Function Call, Empty Outside Any Function
+POSITIONAL: list[str] = []
+
+
+class Quoting(Enum):
+    NONE = "none"
+    DOUBLE = "double"
+    SINGLE = "single"
+    # Text of a $(...) or `...` Substitution, Unquoted or Inside Double Quotes
+    COMMAND = "command"
+    QUOTED_COMMAND = "quoted_command"
+
+
+# A Word Still Holding $ or Glob Characters, Kept Split by Quoting Until it is Run
+class Word:
+    __slots__ = ("parts",)
+
+    def __init__(self, parts: tuple[tuple[str, Quoting], ...]) -> None:
+        self.parts = parts
+
+
+# Only Words With Something to Expand Become a Word, Everything Else Stays a Plain String
+def make_word(parts: list[tuple[str, Quoting]]) -> str | Word:
+    for text, quoting in parts:
+        if quoting in (Quoting.COMMAND, Quoting.QUOTED_COMMAND):
+            return Word(tuple(parts))
+        if quoting != Quoting.SINGLE and "$" in text:
+            return Word(tuple(parts))
+        if quoting == Quoting.NONE and GLOB_MAGIC.search(text):
+            return Word(tuple(parts))
+    return "".join(text for text, _ in parts)
+
+
+# capture Runs the Text of a Command Substitution and Returns What it Printed
+def expand_words(
+    words: tuple[str | Word, ...], status: int, capture: Callable[[str], str]
+) -> list[str]:
+    result = []
+    for word in words:
+        if isinstance(word, str):
+            result.append(word)
+        else:
+            result.extend(expand_word(word, status, capture))
+    return result
+
+
+# Substitutions and Variables, Then Field Splitting of Unquoted Results, Then Globbing
+def expand_word(word: Word, status: int, capture: Callable[[str], str]) -> list[str]:
+    # Each Field is a List of (Text, Globbable) Pieces, Quoted Text Never Globs
+    fields: list[list[tuple[str, bool]]] = [[]]
+    quoted = [False]
+    for text, quoting in word.parts:
+        if quoting == Quoting.SINGLE:
+            fields[-1].append((text, False))
+            quoted[-1] = True
+        elif quoting == Quoting.DOUBLE:
+            fields[-1].append((substitute(text, status), False))
+            quoted[-1] = True
+        elif quoting == Quoting.QUOTED_COMMAND:
+            fields[-1].append((strip_newlines(capture(text)), False))
+            quoted[-1] = True
+        elif quoting == Quoting.COMMAND:
+            split_value(strip_newlines(capture(text)), fields, quoted)
+        else:
+            split_unquoted(text, status, fields, quoted)
+
+    result = []
+    for pieces, was_quoted in zip(fields, quoted):
+        if not pieces and not was_quoted:
+            continue
+        literal = "".join(text for text, _ in pieces)
+        if any(globbable and GLOB_MAGIC.search(text) for text, globbable in pieces):
+            pattern = "".join(
+                text if globbable else glob_escape(text) for text, globbable in pieces
+            )
+            # No Match Leaves the Word as Written, Same as bash Without nullglob
+            result.extend(sorted(iglob(pattern)) or [literal])
+        else:
+            result.append(literal)
+    return result
+
+
+# Unquoted Variable Values are Split on Whitespace Into Separate Fields
+def split_unquoted(
+    text: str, status: int, fields: list[list[tuple[str, bool]]], quoted: list[bool]
+) -> None:
+    position = 0
+    for match in VARIABLE.finditer(text):
+        if match.start() > position:
+            fields[-1].append((text[position : match.start()], True))
+        position = match.end()
+
+        split_value(lookup(match.group(1) or match.group(2), status), fields, quoted)
+    if position < len(text):
+        fields[-1].append((text[position:], True))
+
+
+def split_value(value: str, fields: list[list[tuple[str, bool]]], quoted: list[bool]) -> None:
+    for i, piece in enumerate(re.split(f"[{FIELD_SEPARATORS}]+", value)):
+        if i and (fields[-1] or quoted[-1]):
+            fields.append([])
+            quoted.append(False)
+        if piece:
+            fields[-1].append((piece, True))
+
+
+# Every Trailing Newline is Dropped, as POSIX Requires of Command Substitution
+def strip_newlines(output: str) -> str:
+    return output.rstrip("\n")
+
+
+def substitute(text: str, status: int) -> str:
+    if "$" not in text:
+        return text
+    return VARIABLE.sub(lambda match: lookup(match.group(1) or match.group(2), status), text)
+
+
+# Unset Variables Expand to Nothing
+def lookup(name: str, status: int) -> str:
+    if name == "?":
+        return str(status)
+    if name == "#":
+        return str(len(POSITIONAL))
+    # $@ Joins Like $*, Then Splits Into Fields Wherever it is Unquoted
+    if name in ("@", "*"):
+        return " ".join(POSITIONAL)
+    if name.isdigit():
+        index = int(name) - 1
+        return POSITIONAL[index] if index < len(POSITIONAL) else ""
+    return os.environ.get(name, "")
+
+
+# $1, $2 and so on Name the Arguments of the Function Being Called
+@contextlib.contextmanager
+def positional(args: list[str]) -> Iterator[None]:
+    global POSITIONAL
+    saved, POSITIONAL = POSITIONAL, list(args)
+    try:
+        yield
+    finally:
+        POSITIONAL = saved
+
+
+# Brackets Around Each Magic Character Make it Match Only Itself
+def glob_escape(text: str) -> str:
+    return GLOB_MAGIC.sub(r"[\g<0>]", text)
+
+
+@functools.lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def compile_pattern(component: str) -> Callable[[str], re.Match | None]:
+    return re.compile(fnmatch.translate(component)).match
+
+
+# Yields Matches One Directory Entry at a Time, Only Matching Names are Ever Held
+def iglob(pattern: str) -> Iterator[str]:
+    components = [component for component in pattern.split("/") if component]
+    if not components:
+        return
+    base = "/" if pattern.startswith("/") else ""
+    yield from glob_components(base, components, pattern.endswith("/"))
+
+
+def glob_components(base: str, components: list[str], dirs_only: bool) -> Iterator[str]:
+    component, rest = components[0], components[1:]
+    suffix = "/" if dirs_only and not rest else ""
+
+    # Components Without Magic are Joined Straight On, Only the Full Path is Checked
+    if not GLOB_MAGIC.search(component):
+        path = f"{base}{component}"
+        if rest:
+            yield from glob_components(f"{path}/", rest, dirs_only)
+        elif os.path.isdir(path) if dirs_only else os.path.lexists(path):
+            yield f"{path}{suffix}"
+        return
+
+    match = compile_pattern(component)
+    # Hidden Names Only Match a Component That Itself Starts With a Dot
+    hidden = component.startswith(".")
+    try:
+        with os.scandir(base or ".") as entries:
+            for entry in entries:
+                name = entry.name
+                if (name.startswith(".") and not hidden) or not match(name):
+                    continue
+                if (rest or dirs_only) and not entry.is_dir():
+                    continue
+                if rest:
+                    yield from glob_components(f"{base}{name}/", rest, dirs_only)
+                else:
+                    yield f"{base}{name}{suffix}"
+    except OSError:
+        return
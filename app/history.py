@@ -0,0 +1,184 @@
+import os, re, mmap, fcntl, heapq, threading, functools
+from collections import defaultdict
+from typing import Iterator
+
+
+HISTORY_ENV = "PERSONAL_SHELL_HISTORY"
+DEFAULT_HISTORY_FILE = "~/.personal_shell_history"
+# Most Recent Entries Handed to the Line Editor at Startup
+HISTORY_LOAD_SIZE = 1000
+GRAM_SIZE = 3
+# Indexing Works Through the File in Slices so No Single Call Holds the GIL for Long
+INDEX_CHUNK_SIZE = 256 * 1024
+# Seconds Indexing Waits so it Does Not Compete With Drawing the First Prompt
+INDEX_DELAY = 0.25
+# A Backslash Pair Decodes Back to the Byte it Stands For
+ESCAPE_PATTERN = re.compile(rb"\\(.)", re.DOTALL)
+ESCAPES = {b"\\": b"\\", b"n": b"\n"}
+
+
+def history_path() -> str:
+    return os.path.expanduser(os.environ.get(HISTORY_ENV, DEFAULT_HISTORY_FILE))
+
+
+# Sessions Without a Writable History File Simply Go Unrecorded
+def open_history() -> "History | None":
+    try:
+        return History(history_path())
+    except OSError:
+        return None
+
+
+# Append-Only History File Shared by Every Session, Read Through mmap and Indexed by Trigram
+class History:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+        self._map: mmap.mmap | None = None
+        self._lock = threading.Lock()
+        # Bytes of the File Already Indexed and the Number of Entries They Hold
+        self._indexed = 0
+        self._count = 0
+        # Dedup Hash: Each Distinct Entry -> Number of its Latest Occurrence
+        self._latest: dict[bytes, int] = {}
+        # Every Three Byte Slice -> Distinct Entries Containing It
+        self._grams: dict[bytes, set[bytes]] = defaultdict(set)
+
+    # Builds the Index on a Daemon Thread, the First Search Waits Only if it is Still Running
+    def index_in_background(self) -> None:
+        timer = threading.Timer(INDEX_DELAY, self.refresh)
+        timer.daemon = True
+        timer.start()
+
+    # Appends One Entry, the Lock Keeps Concurrent Sessions From Interleaving Writes
+    def append(self, entry: str) -> None:
+        if not (entry := entry.strip()):
+            return
+        data = escape_entry(entry.encode()) + b"\n"
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            os.write(self.fd, data)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    # Most Recent Entries First, Read Backwards Through a Map of its Own so Indexing Never Blocks it
+    def recent(self, limit: int = HISTORY_LOAD_SIZE) -> list[str]:
+        if not (size := os.fstat(self.fd).st_size):
+            return []
+        with mmap.mmap(self.fd, size, access=mmap.ACCESS_READ) as buffer:
+            end = buffer.rfind(b"\n") + 1
+            return [
+                unescape_entry(line).decode(errors="replace")
+                for line in lines_before(buffer, end, limit)
+            ]
+
+    # Last limit Entries (All if None) as (Number, Entry), Oldest First
+    def entries(self, limit: int | None = None) -> list[tuple[int, str]]:
+        self.refresh()
+        with self._lock:
+            if not (buffer := self._mapped()):
+                return []
+            if limit is None:
+                lines = buffer[: self._indexed].split(b"\n")[:-1]
+            else:
+                lines = list(lines_before(buffer, self._indexed, limit))[::-1]
+            first = self._count - len(lines) + 1
+            return [
+                (first + i, unescape_entry(line).decode(errors="replace"))
+                for i, line in enumerate(lines)
+            ]
+
+    # Distinct Entries Containing text as (Latest Number, Entry), Most Recent First
+    def search(self, text: str, limit: int | None = None) -> list[tuple[int, str]]:
+        self.refresh()
+        text_bytes = text.encode()
+        # Entries are Indexed as Stored, so the Query is Escaped the Same Way
+        query = escape_entry(text_bytes)
+        with self._lock:
+            if len(query) < GRAM_SIZE:
+                matches = [entry for entry in self._latest if text_bytes in unescape_entry(entry)]
+            else:
+                postings = []
+                for i in range(len(query) - GRAM_SIZE + 1):
+                    if not (posting := self._grams.get(query[i : i + GRAM_SIZE])):
+                        return []
+                    postings.append(posting)
+                # Intersect Smallest First so Each Step Only Shrinks
+                postings.sort(key=len)
+                candidates = functools.reduce(set.intersection, postings[1:], postings[0])
+                # Checked Against the Decoded Entry so an Escape Cannot Fake a Match
+                matches = [entry for entry in candidates if text_bytes in unescape_entry(entry)]
+
+            # Only the Most Recent limit Matches are Ordered When a Limit is Given
+            if limit is None:
+                matches.sort(key=self._latest.__getitem__, reverse=True)
+            else:
+                matches = heapq.nlargest(limit, matches, key=self._latest.__getitem__)
+            return [
+                (self._latest[entry], unescape_entry(entry).decode(errors="replace"))
+                for entry in matches
+            ]
+
+    # Indexes Whatever Any Session Appended Since the Last Call
+    def refresh(self) -> None:
+        with self._lock:
+            if not (buffer := self._mapped()):
+                return
+            # A Line Another Session is Still Writing is Left For Next Time
+            end = buffer.rfind(b"\n", self._indexed) + 1
+            if end <= self._indexed:
+                return
+
+            latest, grams, count = self._latest, self._grams, self._count
+            start = self._indexed
+            while start < end:
+                stop = buffer.find(b"\n", min(start + INDEX_CHUNK_SIZE, end - 1)) + 1
+                for line in buffer[start : stop - 1].split(b"\n"):
+                    count += 1
+                    if line not in latest:
+                        for i in range(len(line) - GRAM_SIZE + 1):
+                            grams[line[i : i + GRAM_SIZE]].add(line)
+                    latest[line] = count
+                start = stop
+            self._count, self._indexed = count, end
+
+    def __len__(self) -> int:
+        self.refresh()
+        return self._count
+
+    # Remaps Only When the File Has Grown, an Empty File Cannot be Mapped
+    def _mapped(self) -> mmap.mmap | None:
+        size = os.fstat(self.fd).st_size
+        if self._map is not None and size < len(self._map):
+            # File Was Truncated or Rewritten, Reading Past its End Would Fault
+            self._map.close()
+            self._map = None
+            self._indexed = self._count = 0
+            self._latest.clear()
+            self._grams.clear()
+        if size and (self._map is None or len(self._map) < size):
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self.fd, size, access=mmap.ACCESS_READ)
+        return self._map
+
+
+# Walks Lines Backwards From end, Each rfind Touches Only the Pages it Needs
+def lines_before(buffer: mmap.mmap, end: int, limit: int | None) -> Iterator[bytes]:
+    produced = 0
+    while end > 0 and (limit is None or produced < limit):
+        start = buffer.rfind(b"\n", 0, end - 1) + 1
+        yield buffer[start : end - 1]
+        produced += 1
+        end = start
+
+
+# Keeps One Line per Entry on Disk: a Newline is Stored as Backslash n, a Backslash Doubled
+def escape_entry(entry: bytes) -> bytes:
+    return entry.replace(b"\\", b"\\\\").replace(b"\n", b"\\n")
+
+
+def unescape_entry(line: bytes) -> bytes:
+    if b"\\" not in line:
+        return line
+    return ESCAPE_PATTERN.sub(lambda match: ESCAPES.get(match[1], match[0]), line)
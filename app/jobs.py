@@ -0,0 +1,256 @@
+import sys, os, signal, selectors, termios
+from enum import Enum
+from app.usage import wait_child
+
+
+class JobState(Enum):
+    RUNNING = "Running"
+    STOPPED = "Stopped"
+    DONE = "Done"
+
+
+class Job:
+    def __init__(self, command: str, background: bool = False) -> None:
+        self.command = command.strip().removesuffix("&").rstrip()
+        self.background = background
+        self.job_id = None
+        self.pgid = None
+        # Process Handles are Held Until Reaped so Nothing Waits on a Recycled PID
+        self.processes = {}
+        self.statuses: dict[int, int] = {}
+        self.stopped = False
+        # Set When a Builtin Section Ran a Bare exit, the Shell Exits Once the Job is Done
+        self.force_exit = False
+
+    # None Keeps Children in the Shell Group, 0 Starts a New Group Led by the First Child
+    @property
+    def process_group(self) -> int | None:
+        if not self.background:
+            return None
+        return self.pgid or 0
+
+    def add(self, process) -> None:
+        self.processes[process.pid] = process
+        if self.background and self.pgid is None:
+            self.pgid = process.pid
+
+    @property
+    def pids(self) -> list[int]:
+        return list(self.processes)
+
+    @property
+    def running_pids(self) -> list[int]:
+        return [pid for pid in self.processes if pid not in self.statuses]
+
+    @property
+    def done(self) -> bool:
+        return not self.running_pids
+
+    @property
+    def state(self) -> JobState:
+        if self.done:
+            return JobState.DONE
+        return JobState.STOPPED if self.stopped else JobState.RUNNING
+
+    def record(self, pid: int, status: int) -> None:
+        if os.WIFSTOPPED(status):
+            self.stopped = True
+            return
+        self.statuses[pid] = status
+
+    # Reaps Only This Job's Own Children, Returning Early if the Job Gets Stopped
+    def wait(self, untraced: bool = False) -> None:
+        for pid in self.running_pids:
+            try:
+                _, status = wait_child(pid, os.WUNTRACED if untraced else 0)
+            except ChildProcessError:
+                status = 0
+            self.record(pid, status)
+            if self.stopped:
+                break
+
+    # Non-blocking Check of Each Remaining Child for Exits and Stops
+    def poll(self) -> None:
+        for pid in self.running_pids:
+            try:
+                reaped, status = wait_child(pid, os.WNOHANG | os.WUNTRACED)
+            except ChildProcessError:
+                reaped, status = pid, 0
+            if reaped:
+                self.record(pid, status)
+
+    def signal(self, signum: int) -> None:
+        try:
+            if self.pgid:
+                os.killpg(self.pgid, signum)
+            else:
+                for pid in self.running_pids:
+                    os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def describe(self, marker: str = " ") -> str:
+        command = f"{self.command} &" if self.state == JobState.RUNNING else self.command
+        return f"[{self.job_id}]{marker}  {self.state.value:<24}{command}"
+
+
+class JobTable:
+    def __init__(self) -> None:
+        self.jobs: dict[int, Job] = {}
+        # Each Background Child Gets a pidfd, Readable Once it Exits
+        self.selector = selectors.DefaultSelector()
+        self.pidfds: dict[int, int] = {}
+
+    def add(self, job: Job) -> int:
+        job.job_id = max(self.jobs, default=0) + 1
+        self.jobs[job.job_id] = job
+        for pid in job.running_pids:
+            self._watch(job, pid)
+        return job.job_id
+
+    def close(self) -> None:
+        for pid in list(self.pidfds):
+            self._unwatch(pid)
+        self.selector.close()
+
+    def _watch(self, job: Job, pid: int) -> None:
+        if not hasattr(os, "pidfd_open"):
+            return
+        try:
+            pidfd = os.pidfd_open(pid)
+        except (ProcessLookupError, OSError):
+            return
+        self.pidfds[pid] = pidfd
+        self.selector.register(pidfd, selectors.EVENT_READ, (job, pid))
+
+    def _unwatch(self, pid: int) -> None:
+        if (pidfd := self.pidfds.pop(pid, None)) is not None:
+            self.selector.unregister(pidfd)
+            os.close(pidfd)
+
+    # Reaps Background Children That Have Exited, Blocking Up to Timeout (None Waits Forever)
+    def reap(self, timeout: float | None = 0) -> None:
+        if not self.pidfds:
+            # Platforms Without pidfd Fall Back to Polling Each Job's Own PIDs
+            for job in self.jobs.values():
+                job.poll()
+            return
+
+        for key, _ in self.selector.select(timeout):
+            job, pid = key.data
+            # A Stop Poll May Have Already Reaped This Child
+            if pid not in job.statuses:
+                try:
+                    _, status = wait_child(pid)
+                except ChildProcessError:
+                    status = 0
+                job.record(pid, status)
+            self._unwatch(pid)
+
+    # Blocks Until Every Given Job has Exited
+    def wait(self, jobs: list[Job]) -> None:
+        while pending := [job for job in jobs if not job.done]:
+            if not self.pidfds:
+                pending[0].wait()
+                continue
+            self.reap(None)
+
+    # Picks Up Jobs Stopped or Finished Since the Last Check
+    def refresh(self) -> None:
+        self.reap()
+        for job in self.jobs.values():
+            job.poll()
+
+    # Collects Finished Jobs and Returns Their Completion Notices
+    def notify(self) -> list[str]:
+        self.reap()
+        notices = []
+        for job_id, marker in self.markers().items():
+            job = self.jobs[job_id]
+            if job.done:
+                notices.append(job.describe(marker))
+                self.remove(job)
+        return notices
+
+    def remove(self, job: Job) -> None:
+        for pid in job.pids:
+            self._unwatch(pid)
+        self.jobs.pop(job.job_id, None)
+
+    # Most Recent Job is the Current (+) Job, the One Before it the Previous (-) Job
+    def markers(self) -> dict[int, str]:
+        ids = sorted(self.jobs)
+        markers = {job_id: " " for job_id in ids}
+        if ids:
+            markers[ids[-1]] = "+"
+        if len(ids) > 1:
+            markers[ids[-2]] = "-"
+        return markers
+
+    # Resolves %n, %+, %%, %- and Bare Job Numbers or PIDs
+    def find(self, spec: str | None) -> Job | None:
+        ids = sorted(self.jobs)
+        if not ids:
+            return None
+        if spec in (None, "%", "%%", "%+"):
+            return self.jobs[ids[-1]]
+        if spec == "%-":
+            return self.jobs[ids[-2]] if len(ids) > 1 else None
+        number = spec.removeprefix("%")
+        if not number.isdigit():
+            return None
+        if spec.startswith("%"):
+            return self.jobs.get(int(number), None)
+        return next(
+            (job for job in self.jobs.values() if int(number) in job.processes), None
+        )
+
+    # Brings a Job to the Foreground, Returning True if One of its Builtins Asked to Exit
+    def foreground(self, job: Job) -> bool:
+        with TerminalControl(job.pgid):
+            if job.stopped:
+                job.stopped = False
+                job.signal(signal.SIGCONT)
+            job.wait(untraced=True)
+
+        if not job.stopped:
+            self.remove(job)
+        return job.force_exit and not job.stopped
+
+    def background(self, job: Job) -> None:
+        job.stopped = False
+        job.signal(signal.SIGCONT)
+
+
+# Hands the Terminal to a Job's Process Group and Takes it Back Along With its Modes
+class TerminalControl:
+    def __init__(self, pgid: int | None) -> None:
+        self.pgid = pgid
+        self.fd = sys.stdin.fileno()
+        self.active = (
+            pgid is not None
+            and os.isatty(self.fd)
+            and os.tcgetpgrp(self.fd) == os.getpgrp()
+        )
+
+    def __enter__(self) -> "TerminalControl":
+        if self.active:
+            self.modes = termios.tcgetattr(self.fd)
+            set_terminal_group(self.fd, self.pgid)
+        return self
+
+    def __exit__(self, *_) -> None:
+        if self.active:
+            set_terminal_group(self.fd, os.getpgrp())
+            termios.tcsetattr(self.fd, termios.TCSADRAIN, self.modes)
+
+
+# A Background Group Calling tcsetpgrp Gets SIGTTOU, Ignore it While Switching
+def set_terminal_group(fd: int, pgid: int) -> None:
+    old_handler = signal.signal(signal.SIGTTOU, signal.SIG_IGN)
+    try:
+        os.tcsetpgrp(fd, pgid)
+    except OSError:
+        pass
+    finally:
+        signal.signal(signal.SIGTTOU, old_handler)
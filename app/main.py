@@ -1,28 +1,105 @@
-import tracemalloc, os
+import tracemalloc, cProfile, pstats, atexit, os, sys, argparse
+from typing import Callable, Iterable
 from app.shell import PersonalShell
+from app.expand import positional
+from app.trace import dump_at_exit
+from app.utils import ExitStatus
+
+
+PROFILE_TOP_N = 25
+ALLOCATION_TOP_N = 10
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="personal-shell")
+    parser.add_argument("-c", dest="command", help="run COMMAND and exit")
+    parser.add_argument(
+        "--parse-all",
+        action="store_true",
+        help="parse the whole script before running any of it",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="report cProfile and tracemalloc statistics on exit",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="serve commands from personal-shell clients over a Unix socket",
+    )
+    parser.add_argument("--socket", help="socket path for --daemon")
+    parser.add_argument("script", nargs="?", help="file of commands to run")
+    parser.add_argument("args", nargs=argparse.REMAINDER)
+    return parser
+
+
+# -c, Script Files and Piped stdin Skip the Interactive Prompt Entirely, None Means Interactive
+def batch_lines(options: argparse.Namespace) -> Iterable[str] | None:
+    if options.command is not None:
+        return options.command.splitlines()
+    if options.script is not None:
+        try:
+            with open(options.script) as script:
+                return script.readlines()
+        except OSError as e:
+            # Same Statuses as bash: 127 for a Missing Script, 126 When it Cannot be Read
+            sys.stderr.write(f"personal-shell: {options.script}: {e.strerror}\n")
+            missing = isinstance(e, FileNotFoundError)
+            sys.exit((ExitStatus.NOTFOUND if missing else ExitStatus.NOEXEC).value)
+    if not sys.stdin.isatty():
+        return sys.stdin
+    return None
 
 
 def main():
+    options = build_parser().parse_args()
+    if options.daemon:
+        from app.daemon import serve
+
+        try:
+            serve(options.socket)
+        except OSError as e:
+            sys.stderr.write(f"personal-shell: {e}\n")
+            sys.exit(1)
+        return
+
+    # Spans Recorded Under PERSONAL_SHELL_TRACE or set -o trace are Written Out on Exit
+    atexit.register(dump_at_exit)
+    run = profiled if options.profile else lambda func: func()
+
+    if (lines := batch_lines(options)) is None:
+        shell = PersonalShell()
+        run(shell.run)
+        return
+
+    shell = PersonalShell(interactive=False)
+    # Arguments After the Script, or After the $0 Name Given With -c, Become $1 Onwards
+    with positional(options.args):
+        sys.exit(run(lambda: shell.run_batch(lines, options.parse_all)))
+
+
+# Runs the Shell Under cProfile and tracemalloc, Reporting to stderr When it Returns
+def profiled(func: Callable[[], int | None]) -> int | None:
+    tracemalloc.start()
+    snapshot1 = tracemalloc.take_snapshot()
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func)
+    finally:
+        snapshot2 = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        stats = pstats.Stats(profiler, stream=sys.stderr)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_TOP_N)
 
-    shell = PersonalShell()
-    shell.run()
-
-    # tracemalloc.start()
-    # snapshot1 = tracemalloc.take_snapshot()
-    # # ... run thread-creating code ...
-    # try:
-    #     shell = PersonalShell()
-    #     shell.run()
-    # finally:
-    #     snapshot2 = tracemalloc.take_snapshot()
-    #     top_stats = snapshot2.compare_to(snapshot1, "lineno")
-    #     for stat in top_stats[:10]:
-    #         frame = stat.traceback[0]
-    #         filename = os.path.basename(frame.filename)
-    #         lineno = frame.lineno
-    #         print(
-    #             f"{filename}:{lineno}: size={stat.size_diff / 1024:.1f} KiB, count={stat.count_diff}"
-    #         )
+        top_stats = snapshot2.compare_to(snapshot1, "lineno")
+        for stat in top_stats[:ALLOCATION_TOP_N]:
+            frame = stat.traceback[0]
+            filename = os.path.basename(frame.filename)
+            lineno = frame.lineno
+            sys.stderr.write(
+                f"{filename}:{lineno}: size={stat.size_diff / 1024:.1f} KiB, count={stat.count_diff}\n"
+            )
 
 
 if __name__ == "__main__":
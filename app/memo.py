@@ -0,0 +1,178 @@
+import os, json, time, struct, hashlib, tempfile
+
+
+CACHE_ENV = "PERSONAL_SHELL_CACHE"
+# Entries Past This Many Bytes in Total are Dropped, Least Recently Replayed First
+CACHE_SIZE_LIMIT = 64 << 20
+DEFAULT_TTL = 3600
+# Variables That Change What Most Commands Print, Always Part of the Key
+KEY_ENV = ("PATH", "LANG", "LC_ALL", "LC_COLLATE")
+# Created At, Exit Status, stdout Length, stderr Length, Then Both Streams Back to Back
+ENTRY_HEADER = struct.Struct("!diQQ")
+ENTRY_SUFFIX = ".entry"
+CACHED_USAGE = "cached: usage: cached [--ttl seconds] [--input path] [--env name] command ..."
+
+
+def default_cache_dir() -> str:
+    if directory := os.environ.get(CACHE_ENV, None):
+        return os.path.expanduser(directory)
+    base = os.environ.get("XDG_CACHE_HOME", None) or os.path.expanduser("~/.cache")
+    return os.path.join(base, "personal-shell", "output")
+
+
+# Options Before the Command: --ttl N, --input PATH and --env NAME, the Last Two Repeatable
+class CacheOptions:
+    def __init__(self, args: list[str]) -> None:
+        self.ttl = DEFAULT_TTL
+        self.inputs: list[str] = []
+        self.env: list[str] = []
+        while args and args[0].startswith("-"):
+            flag, *args = args
+            if flag == "--":
+                break
+            if flag not in ("--ttl", "--input", "-i", "--env", "-e") or not args:
+                raise ValueError(CACHED_USAGE)
+            value, *args = args
+            if flag == "--ttl":
+                if not value.isdigit():
+                    raise ValueError(f"cached: {value}: invalid time to live")
+                self.ttl = int(value)
+            elif flag in ("--input", "-i"):
+                self.inputs.append(value)
+            else:
+                self.env.append(value)
+        if not args:
+            raise ValueError(CACHED_USAGE)
+        self.argv = args
+
+
+# Captured Output on Disk, One File per Key so Concurrent Shells Share Entries Safely
+class OutputCache:
+    def __init__(self, directory: str | None = None, limit: int = CACHE_SIZE_LIMIT) -> None:
+        self._directory = directory
+        self.limit = limit
+        # Counted for This Session Only
+        self.hits = self.misses = self.expired = self.stores = self.evictions = 0
+
+    @property
+    def directory(self) -> str:
+        return self._directory or default_cache_dir()
+
+    # Everything That Could Change the Output: argv, Binary, cwd, Environment and Inputs
+    def key(self, file_path: str, options: CacheOptions) -> str:
+        env_names = sorted({*KEY_ENV, *options.env})
+        parts = [
+            options.argv,
+            file_identity(file_path),
+            os.getcwd(),
+            [(name, os.environ.get(name, None)) for name in env_names],
+            [file_identity(os.path.abspath(path)) for path in options.inputs],
+        ]
+        return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+    # (Status, stdout, stderr) of a Fresh Entry, Which Becomes the Most Recently Used
+    def lookup(self, key: str, ttl: int) -> tuple[int, bytes, bytes] | None:
+        path = self._entry_path(key)
+        try:
+            with open(path, "rb") as entry:
+                data = entry.read()
+            created, status, out_length, err_length = ENTRY_HEADER.unpack_from(data)
+        except (OSError, struct.error):
+            self.misses += 1
+            return None
+
+        if time.time() - created >= ttl:
+            self.expired += 1
+            self.misses += 1
+            self._unlink(path)
+            return None
+
+        # The mtime Records the Last Replay and Orders Eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        start = ENTRY_HEADER.size
+        return (
+            status,
+            data[start : start + out_length],
+            data[start + out_length : start + out_length + err_length],
+        )
+
+    def store(self, key: str, status: int, stdout: bytes, stderr: bytes) -> None:
+        header = ENTRY_HEADER.pack(time.time(), status, len(stdout), len(stderr))
+        if len(header) + len(stdout) + len(stderr) > self.limit:
+            return
+        directory = self.directory
+        try:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            # Written Aside and Renamed Into Place so a Reader Never Sees Half an Entry
+            fd, temp_path = tempfile.mkstemp(dir=directory)
+            with open(fd, "wb") as entry:
+                entry.write(header)
+                entry.write(stdout)
+                entry.write(stderr)
+            os.replace(temp_path, self._entry_path(key))
+        except OSError:
+            return
+        self.stores += 1
+        self.evict()
+
+    # Drops the Least Recently Replayed Entries Until the Total Fits the Limit
+    def evict(self) -> None:
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+            if total <= self.limit:
+                break
+            if self._unlink(path):
+                self.evictions += 1
+                total -= size
+
+    def clear(self) -> int:
+        return sum(self._unlink(path) for path, _, _ in self._entries())
+
+    # (Entries, Bytes) Currently on Disk
+    def usage(self) -> tuple[int, int]:
+        entries = self._entries()
+        return len(entries), sum(size for _, size, _ in entries)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{ENTRY_SUFFIX}")
+
+    # (Path, Size, mtime) of Every Entry
+    def _entries(self) -> list[tuple[str, int, int]]:
+        entries = []
+        try:
+            with os.scandir(self.directory) as items:
+                for item in items:
+                    if not item.name.endswith(ENTRY_SUFFIX):
+                        continue
+                    try:
+                        info = item.stat()
+                    except OSError:
+                        continue
+                    entries.append((item.path, info.st_size, info.st_mtime_ns))
+        except OSError:
+            pass
+        return entries
+
+    def _unlink(self, path: str) -> bool:
+        try:
+            os.unlink(path)
+        except OSError:
+            return False
+        return True
+
+
+# Identity Changes Whenever the File is Written, Replaced or Removed
+def file_identity(path: str) -> list:
+    try:
+        info = os.stat(path)
+    except OSError:
+        return [path, None]
+    return [path, info.st_mtime_ns, info.st_ino, info.st_size]
+
+
+OUTPUT_CACHE = OutputCache()
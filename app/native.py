@@ -0,0 +1,333 @@
+import os, mmap, stat
+from typing import Callable, Iterator
+from app.cmd_result import write_all
+
+
+NATIVE_ENV = "PERSONAL_SHELL_NATIVE"
+READ_SIZE = 1 << 20
+SENDFILE_SIZE = 1 << 30
+DEFAULT_LINES = 10
+# GNU wc Pads Counts to This Width Whenever an Input Has No Known Size
+UNSIZED_WIDTH = 7
+
+
+# Raised Before Any Output When a Flag or Input Needs the Real Binary Instead
+class Unsupported(Exception):
+    pass
+
+
+# An Open Operand: Its Name for Messages, Descriptor and Map if it is a Non-Empty Regular File
+# Regular Files Reporting Size 0, Like Those in /proc, are Read as Streams
+class Source:
+    def __init__(self, name: str, fd: int, owned: bool) -> None:
+        self.name = name
+        self.fd = fd
+        self.owned = owned
+        info = os.fstat(fd)
+        self.regular = stat.S_ISREG(info.st_mode)
+        self.size = info.st_size if self.regular else None
+        self.map = (
+            mmap.mmap(fd, 0, access=mmap.ACCESS_READ) if self.regular and self.size else None
+        )
+
+    # Whole Contents, Straight From the Map When There is One
+    def data(self) -> bytes | mmap.mmap:
+        if self.map is not None:
+            return self.map
+        return b"".join(self.chunks())
+
+    def chunks(self) -> Iterator[bytes]:
+        if self.map is not None:
+            for start in range(0, len(self.map), READ_SIZE):
+                yield self.map[start : start + READ_SIZE]
+            return
+        while data := os.read(self.fd, READ_SIZE):
+            yield data
+
+    def close(self) -> None:
+        if self.map is not None:
+            self.map.close()
+        if self.owned:
+            os.close(self.fd)
+
+
+# Opens Each Operand in Turn, "-" or No Operands at All Mean stdin
+def sources(
+    cmd: str, names: list[str], stdin_fd: int, errors: list[str], message: str
+) -> Iterator[Source]:
+    for name in names or ["-"]:
+        try:
+            source = (
+                Source(name, stdin_fd, False)
+                if name == "-"
+                else Source(name, os.open(name, os.O_RDONLY), True)
+            )
+        except OSError as e:
+            errors.append(message.format(cmd=cmd, name=name, error=e.strerror))
+            continue
+        try:
+            yield source
+        finally:
+            source.close()
+
+
+# Splits Flags From Operands, Anything Not in allowed is Left to the Real Binary
+def split_args(
+    args: list[str], allowed: str, valued: str = ""
+) -> tuple[dict[str, str], list[str]]:
+    flags, operands = {}, []
+    args = iter(args)
+    for arg in args:
+        if arg == "--":
+            operands.extend(args)
+            break
+        if arg == "-" or not arg.startswith("-"):
+            operands.append(arg)
+            continue
+        # head -5 and tail -5 are Shorthand for -n 5
+        if valued and arg[1:].isdigit():
+            flags["n"] = arg[1:]
+            continue
+        for i, flag in enumerate(arg[1:], 1):
+            if flag not in allowed:
+                raise Unsupported(arg)
+            if flag in valued:
+                value = arg[i + 1 :] or next(args, None)
+                if value is None:
+                    raise Unsupported(arg)
+                flags[flag] = value
+                break
+            flags[flag] = ""
+    return flags, operands
+
+
+# (Bytes Rather Than Lines, Count, Counted From the Start) for head and tail, Parsed Before
+# Anything is Written so a Fallback to the Real Binary Never Repeats a Header
+def count_flags(flags: dict[str, str], allow_from_start: bool) -> tuple[bool, int, bool]:
+    if "c" in flags:
+        return True, count_value(flags["c"]), False
+    value = flags.get("n", str(DEFAULT_LINES))
+    if allow_from_start and value.startswith("+"):
+        return False, count_value(value[1:]), True
+    return False, count_value(value), False
+
+
+def count_value(value: str) -> int:
+    if not value.isdigit():
+        raise Unsupported(value)
+    return int(value)
+
+
+# Regular Files Go Through sendfile, the Kernel Copies Without Python Touching the Bytes
+def copy_source(source: Source, stdout_fd: int) -> None:
+    if source.regular and source.size:
+        offset = 0
+        try:
+            while offset < source.size:
+                sent = os.sendfile(stdout_fd, source.fd, offset, SENDFILE_SIZE)
+                if not sent:
+                    break
+                offset += sent
+            return
+        except OSError:
+            # Targets sendfile Cannot Write to Fall Back to Writing From the Map
+            write_all(stdout_fd, source.map, source.size)
+            return
+    for chunk in source.chunks():
+        write_all(stdout_fd, chunk, len(chunk))
+
+
+def native_cat(args: list[str], stdin_fd: int | None, stdout_fd: int) -> tuple[int, list[str]]:
+    _, operands = split_args(args, "")
+    needs_stdin(operands, stdin_fd)
+    errors = []
+    for source in sources("cat", operands, stdin_fd, errors, "{cmd}: {name}: {error}"):
+        try:
+            copy_source(source, stdout_fd)
+        except IsADirectoryError as e:
+            errors.append(f"cat: {source.name}: {e.strerror}")
+    return int(bool(errors)), errors
+
+
+def native_head(args: list[str], stdin_fd: int | None, stdout_fd: int) -> tuple[int, list[str]]:
+    flags, operands = split_args(args, "nc", "nc")
+    needs_stdin(operands, stdin_fd)
+    by_bytes, count, _ = count_flags(flags, allow_from_start=False)
+    errors = []
+    message = "{cmd}: cannot open '{name}' for reading: {error}"
+    for i, source in enumerate(sources("head", operands, stdin_fd, errors, message)):
+        if len(operands) > 1:
+            write_header(stdout_fd, source.name, i)
+        try:
+            if by_bytes:
+                data = source.data() if source.map is not None else read_prefix(source, count)
+                write_all(stdout_fd, data, min(count, len(data)))
+            else:
+                head_lines(source, count, stdout_fd)
+        except IsADirectoryError as e:
+            errors.append(f"head: error reading '{source.name}': {e.strerror}")
+    return int(bool(errors)), errors
+
+
+# Stops Reading a Stream as Soon as Enough Lines Have Arrived
+def head_lines(source: Source, lines: int, stdout_fd: int) -> None:
+    if source.map is not None:
+        end = 0
+        for _ in range(lines):
+            if not (end := source.map.find(b"\n", end) + 1):
+                end = len(source.map)
+                break
+        write_all(stdout_fd, source.map, end)
+        return
+
+    remaining = lines
+    for chunk in source.chunks():
+        if remaining <= 0:
+            return
+        newlines = chunk.count(b"\n")
+        if newlines < remaining:
+            write_all(stdout_fd, chunk, len(chunk))
+            remaining -= newlines
+            continue
+        end = 0
+        for _ in range(remaining):
+            end = chunk.find(b"\n", end) + 1
+        write_all(stdout_fd, chunk, end)
+        return
+
+
+def read_prefix(source: Source, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size and (chunk := os.read(source.fd, min(READ_SIZE, size - len(data)))):
+        data += chunk
+    return bytes(data)
+
+
+def native_tail(args: list[str], stdin_fd: int | None, stdout_fd: int) -> tuple[int, list[str]]:
+    # Only Counts From the End and the +N From the Start Form are Handled Here
+    flags, operands = split_args(args, "nc", "nc")
+    needs_stdin(operands, stdin_fd)
+    by_bytes, count, from_start = count_flags(flags, allow_from_start=True)
+    errors = []
+    message = "{cmd}: cannot open '{name}' for reading: {error}"
+    for i, source in enumerate(sources("tail", operands, stdin_fd, errors, message)):
+        if len(operands) > 1:
+            write_header(stdout_fd, source.name, i)
+        try:
+            # Regular Files are Read Backwards From Their End, Streams Must be Read Whole
+            data = source.data()
+            if by_bytes:
+                start = max(len(data) - count, 0)
+            else:
+                start = tail_start(data, count, from_start)
+            with memoryview(data) as view:
+                write_all(stdout_fd, view[start:], len(data) - start)
+        except IsADirectoryError as e:
+            errors.append(f"tail: error reading '{source.name}': {e.strerror}")
+    return int(bool(errors)), errors
+
+
+# Offset Where the Last n Lines Begin, or Where Line n Begins for +n
+def tail_start(data: bytes | mmap.mmap, lines: int, from_start: bool) -> int:
+    if from_start:
+        start = 0
+        for _ in range(lines - 1):
+            if not (start := data.find(b"\n", start) + 1):
+                return len(data)
+        return start
+
+    if not lines:
+        return len(data)
+    # A Final Newline Ends the Last Line Rather Than Starting a New One
+    end = len(data) - 1 if data[-1:] == b"\n" else len(data)
+    for _ in range(lines):
+        if (end := data.rfind(b"\n", 0, end)) < 0:
+            return 0
+    return end + 1
+
+
+def native_wc(args: list[str], stdin_fd: int | None, stdout_fd: int) -> tuple[int, list[str]]:
+    flags, operands = split_args(args, "lwc")
+    needs_stdin(operands, stdin_fd)
+    selected = [flag for flag in "lwc" if flag in flags] or ["l", "w", "c"]
+
+    errors, rows, total_size, unsized = [], [], 0, False
+    for source in sources("wc", operands, stdin_fd, errors, "{cmd}: {name}: {error}"):
+        try:
+            rows.append((count_source(source, selected), source.name))
+        except IsADirectoryError as e:
+            errors.append(f"wc: {source.name}: {e.strerror}")
+            rows.append(({flag: 0 for flag in selected}, source.name))
+        total_size += source.size or 0
+        unsized |= not source.regular
+
+    if len(operands) > 1:
+        rows.append(({flag: sum(row[flag] for row, _ in rows) for flag in selected}, "total"))
+
+    # Same Column Width Rule as GNU wc: Digits of the Summed File Sizes
+    width = 1
+    if len(selected) > 1 or len(rows) > 1:
+        width = max(len(str(total_size)), UNSIZED_WIDTH if unsized else 1)
+
+    lines = []
+    for row, name in rows:
+        counts = " ".join(f"{row[flag]:>{width}}" for flag in selected)
+        lines.append(counts if name == "-" and not operands else f"{counts} {name}")
+    if lines:
+        data = "\n".join(lines).encode() + b"\n"
+        write_all(stdout_fd, data, len(data))
+    return int(bool(errors)), errors
+
+
+# Newlines are Counted a Buffer at a Time, Byte Counts of Regular Files Come From fstat
+def count_source(source: Source, selected: list[str]) -> dict[str, int]:
+    counts = {flag: 0 for flag in selected}
+    if selected == ["c"] and source.size:
+        counts["c"] = source.size
+        return counts
+
+    previous_space = True
+    for chunk in source.chunks():
+        if "l" in counts:
+            counts["l"] += chunk.count(b"\n")
+        if "c" in counts:
+            counts["c"] += len(chunk)
+        if "w" in counts and chunk:
+            words = len(chunk.split())
+            # A Word Cut in Two by the Chunk Boundary Counts Once
+            if words and not previous_space and not chunk[:1].isspace():
+                words -= 1
+            counts["w"] += words
+            previous_space = chunk[-1:].isspace()
+    return counts
+
+
+# Files After the First are Set Apart by a Blank Line, Same as GNU head and tail
+def write_header(stdout_fd: int, name: str, index: int) -> None:
+    label = "standard input" if name == "-" else name
+    header = f"==> {label} <==\n".encode()
+    if index:
+        header = b"\n" + header
+    write_all(stdout_fd, header, len(header))
+
+
+# A Terminal stdin Has to be Read by the Real Binary Under its Own PTY
+def needs_stdin(operands: list[str], stdin_fd: int | None) -> None:
+    if stdin_fd is None and (not operands or "-" in operands):
+        raise Unsupported("-")
+
+
+NATIVES: dict[str, Callable[[list[str], int | None, int], tuple[int, list[str]]]] = {
+    "cat": native_cat,
+    "head": native_head,
+    "tail": native_tail,
+    "wc": native_wc,
+}
+
+
+# Names Listed in PERSONAL_SHELL_NATIVE (or all) Start Enabled
+def enabled_natives() -> set[str]:
+    names = {name.strip() for name in os.environ.get(NATIVE_ENV, "").split(",")}
+    if "all" in names:
+        return set(NATIVES)
+    return names & set(NATIVES)
@@ -0,0 +1,49 @@
+import os, sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+from app.spawn import capture
+from app.trace import TRACE_ENV
+from app.utils import ExitStatus
+
+
+# Worker Shells are Started by the Same Interpreter With This Package on Their Path
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKER_ARGV = [sys.executable, "-m", "app.main", "-c"]
+
+
+# Cores This Process May Actually Run On, Which Can be Fewer Than the Machine Has
+def default_workers() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def worker_env() -> dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        path for path in (PACKAGE_ROOT, env.get("PYTHONPATH")) if path
+    )
+    # Workers Would Otherwise Overwrite the Trace File of the Shell That Started Them
+    env.pop(TRACE_ENV, None)
+    return env
+
+
+# Runs One Command Line in its Own Shell, Capturing Both Streams in Full
+def run_worker(line: str, env: dict[str, str]) -> tuple[int, bytes, bytes]:
+    try:
+        return capture(WORKER_ARGV[0], [*WORKER_ARGV, line], env)
+    except OSError as e:
+        return ExitStatus.NOEXEC.value, b"", f"parallel: {e.strerror}\n".encode()
+
+
+# Yields (Status, stdout, stderr) in Submission Order, At Most workers Lines Run at Once
+# Worker Threads Only Wait on Their Child, so the GIL is Never the Bottleneck
+def run_parallel(lines: list[str], workers: int) -> Iterator[tuple[int, bytes, bytes]]:
+    env = worker_env()
+    with ThreadPoolExecutor(max_workers=min(workers, len(lines))) as executor:
+        try:
+            yield from executor.map(run_worker, lines, [env] * len(lines))
+        except BaseException:
+            # Lines Not Yet Started are Dropped, Running Ones are Left to Finish
+            executor.shutdown(cancel_futures=True)
+            raise
@@ -0,0 +1,582 @@
+import re, functools
+from enum import Enum
+from typing import Callable
+from app.utils import Channel, Redirection
+from app.expand import Quoting, Word, make_word, expand_words
+
+
+PARSE_CACHE_SIZE = 1024
+
+REDIRECTS = {
+    "<": (Channel.INPUT_CH, Channel.READ_MODE),
+    "0<": (Channel.INPUT_CH, Channel.READ_MODE),
+    "<<<": (Channel.INPUT_CH, Channel.HERE_MODE),
+    "<<": (Channel.INPUT_CH, Channel.HERE_MODE),
+    "<<-": (Channel.INPUT_CH, Channel.HERE_MODE),
+    ">": (Channel.OUTPUT_CH, Channel.WRITE_MODE),
+    "1>": (Channel.OUTPUT_CH, Channel.WRITE_MODE),
+    "2>": (Channel.ERROR_CH, Channel.WRITE_MODE),
+    ">>": (Channel.OUTPUT_CH, Channel.APPEND_MODE),
+    "1>>": (Channel.OUTPUT_CH, Channel.APPEND_MODE),
+    "2>>": (Channel.ERROR_CH, Channel.APPEND_MODE),
+}
+
+# Operators Joining Pipelines Into a List, Each Run Depends on the Status Before It
+# An Unquoted Newline Separates Commands Just Like ;
+LIST_OPERATORS = frozenset([";", "&&", "||", "&", "\n"])
+
+# Longest Spelling First so >> is Never Read as Two > and && Never as Two &
+OPERATORS = sorted(
+    [op for op in REDIRECTS if not op[0].isdigit()] + ["|", *LIST_OPERATORS],
+    key=len,
+    reverse=True,
+)
+OPERATOR_STARTS = frozenset(op[0] for op in OPERATORS)
+FD_PREFIXES = frozenset(op[0] for op in REDIRECTS if op[0].isdigit())
+
+# Runs of Characters With No Quoting, Whitespace, Expansion or Operator Meaning
+PLAIN_RUN = re.compile(r"[^\s'\"\\|&<>;$`]+")
+# A $ With the Name After It, Left Whole for Variable Expansion
+DOLLAR_RUN = re.compile(r"\$[^\s'\"\\|&<>;$`]*")
+WHITESPACE = " \t\n"
+DOUBLE_QUOTE_ESCAPES = frozenset('\\"$`\n')
+# Names a Function May be Defined Under
+FUNCTION_NAME = re.compile(r"[A-Za-z_][\w.-]*")
+
+
+class ParseError(Exception):
+    pass
+
+
+# The Line Stopped Inside a Quote, Substitution or Function Body, More Input May Finish it
+class IncompleteInput(ParseError):
+    pass
+
+
+class TokenKind(Enum):
+    WORD = "word"
+    OPERATOR = "operator"
+
+
+# Here-Document Operators, Whose Body Starts on the Line After the Command
+HERE_DOCUMENT_TOKENS = frozenset((TokenKind.OPERATOR, op) for op in ("<<", "<<-"))
+
+
+class Redirect:
+    __slots__ = ("channel", "mode", "target")
+
+    def __init__(self, channel: Channel, mode: Channel, target: str | Word) -> None:
+        self.channel = channel
+        self.mode = mode
+        self.target = target
+
+
+class Command:
+    __slots__ = ("argv", "redirects")
+
+    def __init__(
+        self, argv: tuple[str | Word, ...], redirects: tuple[Redirect, ...]
+    ) -> None:
+        self.argv = argv
+        self.redirects = redirects
+
+
+class Pipeline:
+    __slots__ = ("commands", "background", "text", "timed")
+
+    def __init__(
+        self, commands: tuple[Command, ...], background: bool, text: str, timed: bool = False
+    ) -> None:
+        self.commands = commands
+        self.background = background
+        # Source Text of Just This Pipeline, Used for Job Listings and Messages
+        self.text = text
+        # Set by a Leading time Keyword
+        self.timed = timed
+
+
+# name() { list; } Keeps its Body Parsed, Each Call Only Expands and Runs It
+class FunctionDefinition:
+    __slots__ = ("name", "body", "text")
+
+    def __init__(self, name: str, body: "CommandList", text: str) -> None:
+        self.name = name
+        self.body = body
+        self.text = text
+
+
+# Pipelines With the Operator Deciding Whether Each Runs: None for the First, ; && or ||
+class CommandList:
+    __slots__ = ("items",)
+
+    def __init__(
+        self, items: tuple[tuple[str | None, Pipeline | FunctionDefinition], ...]
+    ) -> None:
+        self.items = items
+
+
+# Single Pass Over the Line, Quotes are Removed and Operators Split Off as They are Met
+# Each Token Also Keeps the Offset it Starts at so Pipelines Can Recover Their Own Text
+# Words are Kept as (Text, Quoting) Parts so Expansion Later Knows What Was Quoted
+def tokenize(line: str) -> list[tuple[TokenKind, str | Word, int]]:
+    tokens = []
+    word, word_start, in_word = [], 0, False
+    i, length = 0, len(line)
+    # Here-Documents Met on the Current Line as (Token Index, Delimiter Parts, Strip Tabs)
+    here_documents = []
+
+    def end_word() -> None:
+        nonlocal word, in_word
+        if in_word:
+            if tokens and tokens[-1][:2] in HERE_DOCUMENT_TOKENS:
+                here_documents.append((len(tokens), word, tokens[-1][1] == "<<-"))
+            tokens.append((TokenKind.WORD, make_word(word), word_start))
+            word, in_word = [], False
+
+    while i < length:
+        char = line[i]
+
+        if char in WHITESPACE:
+            end_word()
+            i += 1
+            if char == "\n":
+                tokens.append((TokenKind.OPERATOR, char, i - 1))
+                # Bodies Follow the Line Their Operators are On, in the Order They Appeared
+                i = read_here_documents(line, i, here_documents, tokens)
+                here_documents.clear()
+            continue
+
+        # Comments Only Start at the Beginning of a Word and Run to the End of the Line
+        if char == "#" and not in_word:
+            if (i := line.find("\n", i)) < 0:
+                break
+            continue
+
+        if not in_word:
+            word_start, in_word = i, True
+
+        if match := PLAIN_RUN.match(line, i):
+            word.append((match.group(), Quoting.NONE))
+            i = match.end()
+
+        elif line.startswith("$(", i):
+            end = find_closing_paren(line, i + 2)
+            word.append((line[i + 2 : end], Quoting.COMMAND))
+            i = end + 1
+
+        elif char == "$":
+            match = DOLLAR_RUN.match(line, i)
+            word.append((match.group(), Quoting.NONE))
+            i = match.end()
+
+        elif char == "`":
+            command, i = read_backquoted(line, i + 1)
+            word.append((command, Quoting.COMMAND))
+
+        elif char == "'":
+            end = line.find("'", i + 1)
+            if end < 0:
+                raise IncompleteInput("unexpected EOF while looking for matching `''")
+            word.append((line[i + 1 : end], Quoting.SINGLE))
+            i = end + 1
+
+        elif char == '"':
+            i = read_double_quoted(line, i + 1, word)
+
+        elif char == "\\":
+            # Escaped Newline Continues the Line, Anything Else is Taken Literally
+            if i + 1 < length and line[i + 1] != "\n":
+                word.append((line[i + 1], Quoting.SINGLE))
+            i += 2
+
+        elif char in OPERATOR_STARTS:
+            operator = next(op for op in OPERATORS if line.startswith(op, i))
+            offset = i
+
+            # A Lone Unquoted 1 or 2 Right Before > Names the Descriptor Being Redirected
+            if (
+                in_word
+                and i - word_start == 1
+                and line[word_start] in FD_PREFIXES
+                and f"{line[word_start]}{operator}" in REDIRECTS
+            ):
+                operator = f"{line[word_start]}{operator}"
+                offset = word_start
+                word, in_word = [], False
+            elif i == word_start:
+                in_word = False
+            end_word()
+            tokens.append((TokenKind.OPERATOR, operator, offset))
+            i += len(operator) - (operator[0] in FD_PREFIXES)
+
+        else:
+            raise ParseError(f"syntax error near unexpected token `{char}'")
+
+    end_word()
+    if here_documents:
+        raise IncompleteInput("unexpected EOF while looking for here-document delimiter")
+    return tokens
+
+
+# Replaces Each Delimiter Token With its Body, Returning Where Tokenizing Resumes
+def read_here_documents(
+    line: str,
+    i: int,
+    here_documents: list[tuple[int, list[tuple[str, Quoting]], bool]],
+    tokens: list[tuple[TokenKind, str | Word, int]],
+) -> int:
+    for index, parts, strip_tabs in here_documents:
+        delimiter = "".join(text for text, _ in parts)
+        body = []
+        while True:
+            if i >= len(line):
+                raise IncompleteInput(
+                    f"unexpected EOF while looking for here-document delimiter `{delimiter}'"
+                )
+            end = line.find("\n", i)
+            end = len(line) if end < 0 else end
+            text, i = line[i:end], end + 1
+            if strip_tabs:
+                text = text.lstrip("\t")
+            if text == delimiter:
+                break
+            body.append(f"{text}\n")
+
+        # A Quoted Delimiter Keeps the Body Literal, Otherwise $ and ` Expand Like in Double Quotes
+        quoted = any(quoting != Quoting.NONE for _, quoting in parts)
+        text = "".join(body)
+        tokens[index] = (
+            TokenKind.WORD,
+            text if quoted else here_document_word(text),
+            tokens[index][2],
+        )
+    return min(i, len(line))
+
+
+def here_document_word(text: str) -> str | Word:
+    parts, start, i = [], 0, 0
+    while i < len(text):
+        if text.startswith("$(", i) or text[i] == "`":
+            parts.append((text[start:i], Quoting.DOUBLE))
+            if text[i] == "`":
+                command, i = read_backquoted(text, i + 1)
+            else:
+                end = find_closing_paren(text, i + 2)
+                command, i = text[i + 2 : end], end + 1
+            parts.append((command, Quoting.QUOTED_COMMAND))
+            start = i
+        elif text[i] == "\\" and i + 1 < len(text) and text[i + 1] in "\\$`":
+            parts.append((text[start:i], Quoting.DOUBLE))
+            parts.append((text[i + 1], Quoting.SINGLE))
+            i += 2
+            start = i
+        else:
+            i += 1
+    parts.append((text[start:], Quoting.DOUBLE))
+    return make_word(parts)
+
+
+# A Here-String is One Word Followed by a Newline, Never Split Into Fields or Globbed
+def here_string(word: str | Word) -> str | Word:
+    if isinstance(word, str):
+        return f"{word}\n"
+    parts = [
+        (
+            text,
+            {
+                Quoting.NONE: Quoting.DOUBLE,
+                Quoting.COMMAND: Quoting.QUOTED_COMMAND,
+            }.get(quoting, quoting),
+        )
+        for text, quoting in word.parts
+    ]
+    return Word((*parts, ("\n", Quoting.SINGLE)))
+
+
+# Inside Double Quotes a Backslash Only Escapes \ " $ ` and Newline
+def read_double_quoted(line: str, i: int, word: list[tuple[str, Quoting]]) -> int:
+    start = i
+    while i < len(line):
+        char = line[i]
+        if char == '"':
+            word.append((line[start:i], Quoting.DOUBLE))
+            return i + 1
+        # Substitutions Inside Quotes Keep Their Output as One Word
+        if line.startswith("$(", i) or char == "`":
+            word.append((line[start:i], Quoting.DOUBLE))
+            if char == "`":
+                command, i = read_backquoted(line, i + 1)
+            else:
+                end = find_closing_paren(line, i + 2)
+                command, i = line[i + 2 : end], end + 1
+            word.append((command, Quoting.QUOTED_COMMAND))
+            start = i
+            continue
+        if char == "\\" and i + 1 < len(line) and line[i + 1] in DOUBLE_QUOTE_ESCAPES:
+            word.append((line[start:i], Quoting.DOUBLE))
+            if line[i + 1] != "\n":
+                word.append((line[i + 1], Quoting.SINGLE))
+            i += 2
+            start = i
+            continue
+        i += 1
+    raise IncompleteInput('unexpected EOF while looking for matching `"\'')
+
+
+# Index of the ) Closing a $( Opened Just Before start, Skipping Quoted and Nested Parentheses
+def find_closing_paren(line: str, start: int) -> int:
+    depth, i = 1, start
+    while i < len(line):
+        char = line[i]
+        if char == "\\":
+            i += 2
+            continue
+        if char == "'":
+            if (i := line.find("'", i + 1)) < 0:
+                break
+        elif char == '"':
+            i = read_double_quoted(line, i + 1, []) - 1
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if not depth:
+                return i
+        i += 1
+    raise IncompleteInput("unexpected EOF while looking for matching `)'")
+
+
+# Text Between Backquotes, Where a Backslash Only Escapes \ ` and $
+def read_backquoted(line: str, i: int) -> tuple[str, int]:
+    command = []
+    while i < len(line):
+        char = line[i]
+        if char == "`":
+            return "".join(command), i + 1
+        if char == "\\" and i + 1 < len(line) and line[i + 1] in "\\`$":
+            char = line[i + 1]
+            i += 1
+        command.append(char)
+        i += 1
+    raise IncompleteInput("unexpected EOF while looking for matching ``'")
+
+
+class Parser:
+    def __init__(self, tokens: list[tuple[TokenKind, str | Word, int]], line: str) -> None:
+        self.tokens = tokens
+        self.line = line
+        self.position = 0
+        # Function Bodies Still Waiting for Their Closing }
+        self.depth = 0
+
+    def peek(self) -> tuple[TokenKind, str | Word, int] | None:
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    # Operator at the Current Position, None for Words or the End of the Line
+    def peek_operator(self) -> str | None:
+        if (token := self.peek()) and token[0] == TokenKind.OPERATOR:
+            return token[1]
+        return None
+
+    def advance(self) -> tuple[TokenKind, str | Word, int]:
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def error(self) -> ParseError:
+        token = self.peek()
+        if not token and self.depth:
+            return IncompleteInput("syntax error: unexpected end of file")
+        if not token or token[1] == "\n":
+            return ParseError("syntax error near unexpected token `newline'")
+        return ParseError(f"syntax error near unexpected token `{token[1]}'")
+
+    def skip_newlines(self) -> None:
+        while self.peek_operator() == "\n":
+            self.advance()
+
+    # A Closing } Counts Only Where a Command Could Start
+    def at_closing_brace(self) -> bool:
+        return (token := self.peek()) is not None and token[:2] == (TokenKind.WORD, "}")
+
+    # A Trailing ; & or Newline Ends the List, && and || Must Have a Pipeline After Them
+    # Inside a Function Body the List Also Ends Right Before its Closing }
+    def parse_list(self, in_body: bool = False) -> CommandList:
+        items, connector = [], None
+        self.skip_newlines()
+        while True:
+            items.append((connector, self.parse_item()))
+            if not (connector := self.peek_operator()) or connector not in LIST_OPERATORS:
+                break
+            self.advance()
+            self.skip_newlines()
+            if connector in (";", "&", "\n") and (
+                not self.peek() or (in_body and self.at_closing_brace())
+            ):
+                break
+            # Whatever Follows a Background Pipeline Runs Unconditionally
+            if connector in ("&", "\n"):
+                connector = ";"
+        return CommandList(tuple(items))
+
+    def parse_item(self) -> Pipeline | FunctionDefinition:
+        if name := self.function_name():
+            return self.parse_function(name)
+        return self.parse_pipeline()
+
+    # Spots name() { or name () { Without Consuming Anything
+    def function_name(self) -> str | None:
+        words = []
+        for kind, value, _ in self.tokens[self.position : self.position + 3]:
+            if kind != TokenKind.WORD or not isinstance(value, str):
+                break
+            words.append(value)
+        if len(words) >= 2 and words[0].endswith("()") and words[1] == "{":
+            name = words[0][:-2]
+        elif len(words) == 3 and words[1] == "()" and words[2] == "{":
+            name = words[0]
+        else:
+            return None
+        return name if FUNCTION_NAME.fullmatch(name) else None
+
+    def parse_function(self, name: str) -> FunctionDefinition:
+        start = self.peek()[2]
+        while self.advance()[1] != "{":
+            pass
+        self.depth += 1
+        body = self.parse_list(in_body=True)
+        if not self.at_closing_brace():
+            raise self.error()
+        self.depth -= 1
+        end = self.advance()[2] + 1
+        return FunctionDefinition(name, body, self.line[start:end])
+
+    def parse_pipeline(self) -> Pipeline:
+        # time is Only a Keyword When a Command Follows It
+        timed = (
+            self.peek() is not None
+            and self.peek()[:2] == (TokenKind.WORD, "time")
+            and self.position + 1 < len(self.tokens)
+            and self.tokens[self.position + 1][0] == TokenKind.WORD
+        )
+        if timed:
+            self.advance()
+
+        start = self.peek()[2] if self.peek() else len(self.line)
+        commands = [self.parse_command()]
+        while self.peek_operator() == "|":
+            self.advance()
+            self.skip_newlines()
+            commands.append(self.parse_command())
+
+        # Text Runs Up to the Separator parse_list Consumes, Keeping a Trailing &
+        background = self.peek_operator() == "&"
+        end = self.peek()[2] + background if self.peek() else len(self.line)
+        return Pipeline(tuple(commands), background, self.line[start:end].strip(), timed)
+
+    def parse_command(self) -> Command:
+        argv, redirects = [], []
+        while token := self.peek():
+            kind, value, _ = token
+            if kind == TokenKind.WORD:
+                argv.append(value)
+                self.advance()
+            elif value in REDIRECTS:
+                self.advance()
+                target = self.peek()
+                if not target or target[0] != TokenKind.WORD:
+                    raise self.error()
+                self.advance()
+                target = here_string(target[1]) if value == "<<<" else target[1]
+                redirects.append(Redirect(*REDIRECTS[value], target))
+            else:
+                break
+
+        if not argv:
+            raise self.error()
+        return Command(tuple(argv), tuple(redirects))
+
+
+# True While a Quote or Body is Still Open, Parsing it Now Leaves the Result Cached
+def is_incomplete(line: str) -> bool:
+    try:
+        parse(line)
+    except IncompleteInput:
+        return True
+    except ParseError:
+        return False
+    return False
+
+
+# Appends Already Expanded Arguments to the Last Command, as if Typed After an Alias
+def with_arguments(command_list: CommandList, args: list[str]) -> CommandList:
+    *items, (connector, pipeline) = command_list.items
+    if not args or isinstance(pipeline, FunctionDefinition):
+        return command_list
+    *commands, last = pipeline.commands
+    last = Command((*last.argv, *args), last.redirects)
+    pipeline = Pipeline((*commands, last), pipeline.background, pipeline.text, pipeline.timed)
+    return CommandList((*items, (connector, pipeline)))
+
+
+# A Redirection Must Expand to Exactly One File Name
+def expand_target(target: str | Word, status: int, capture: Callable[[str], str]) -> str:
+    if isinstance(target, str):
+        return target
+    if len(names := expand_words((target,), status, capture)) != 1:
+        raise ParseError(f"{''.join(text for text, _ in target.parts)}: ambiguous redirect")
+    return names[0]
+
+
+# Repeated Lines From History or Loops in Scripts are Served From the Cache
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse(line: str) -> CommandList | None:
+    tokens = tokenize(line)
+    if all(token[1] == "\n" for token in tokens):
+        return None
+
+    parser = Parser(tokens, line)
+    command_list = parser.parse_list()
+    if parser.peek():
+        raise parser.error()
+    return command_list
+
+
+# Expands Words and Opens the Redirections of a Parsed Pipeline Right Before it Runs
+def build_pipeline(
+    pipeline: Pipeline, status: int, capture: Callable[[str], str]
+) -> tuple[list[tuple[str, list[str], Redirection]], tuple[str, list[str], Redirection], bool]:
+    sections = []
+    for command in pipeline.commands:
+        redirects, channels = [], {}
+        for redirect in command.redirects:
+            # Previous Redirection Gets Logged For Continued File Creation
+            channel = channels.get(redirect.channel, None)
+            if channel and redirect.channel != Channel.INPUT_CH:
+                redirects.append(channel[0])
+
+            # Current Redirection Becomes Actual Output or Error File with New Mode
+            channels[redirect.channel] = (
+                expand_target(redirect.target, status, capture),
+                redirect.mode,
+            )
+
+        # A Command Expanding to Nothing is Reported as an Empty Name
+        cmd, *args = expand_words(command.argv, status, capture) or [""]
+        sections.append((cmd, args, redirects, channels))
+
+    # Every Section Shares a Pipe Unless the Pipeline is a Single Foreground Command
+    is_piped = len(sections) > 1 or pipeline.background
+    cmdlines = []
+    try:
+        for cmd, args, redirects, channels in sections:
+            cmdlines.append((cmd, args, Redirection(redirects, channels, is_piped)))
+    except OSError as e:
+        # A File That Cannot be Opened Stops the Pipeline Before Anything Runs
+        for _, _, context in cmdlines:
+            context.close()
+        raise ParseError(f"{e.filename}: {e.strerror}") from e
+    *pipe_sections, last_cmdline = cmdlines
+    return pipe_sections, last_cmdline, pipeline.background
@@ -0,0 +1,215 @@
+import os, struct
+from typing import Iterable, Iterator
+from app.cmd_hash import dir_mtime, is_executable
+from app.completion import CompletionIndex
+
+
+# inotify Event Bits, From <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+# Entries Appearing, Disappearing or Changing Mode, Plus the Directory Itself Going Away
+WATCH_MASK = (
+    IN_ATTRIB
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+DIRECTORY_GONE = IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED
+# struct inotify_event: wd, mask, cookie, len, Then len Bytes of NUL Padded Name
+EVENT_HEADER = struct.Struct("iIII")
+EVENT_READ_SIZE = 1 << 16
+
+
+# Watches Directories Through inotify, Called Directly via ctypes so Nothing Needs Installing
+class DirectoryWatcher:
+    def __init__(self, libc, fd: int) -> None:
+        self._libc = libc
+        self.fd = fd
+        # Two PATH Entries Naming the Same Directory Share One wd, So Each wd Maps to a List
+        self._directories: dict[int, list[str]] = {}
+        self._watches: dict[str, int] = {}
+
+    # None Where inotify is Missing, Such as macOS, or Where No Instance Can be Created
+    @classmethod
+    def open(cls) -> "DirectoryWatcher | None":
+        try:
+            import ctypes
+
+            libc = ctypes.CDLL(None, use_errno=True)
+            init = libc.inotify_init1
+        except (ImportError, OSError, AttributeError):
+            return None
+        # The Descriptor Must Not Leak Into Spawned Commands or Block Between Prompts
+        fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return cls(libc, fd)
+
+    # False When the Directory Cannot be Watched, the Caller Falls Back to Polling it
+    def add(self, directory: str) -> bool:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            return False
+        directories = self._directories.setdefault(wd, [])
+        if directory not in directories:
+            directories.append(directory)
+        self._watches[directory] = wd
+        return True
+
+    # The Watch Itself Goes Only Once No Other Entry Shares it
+    def remove(self, directory: str) -> None:
+        if (wd := self._watches.pop(directory, None)) is None:
+            return
+        directories = self._directories[wd]
+        directories.remove(directory)
+        if not directories:
+            del self._directories[wd]
+            self._libc.inotify_rm_watch(self.fd, wd)
+
+    # Yields (Directory, Name, Mask) for Every Queued Event Without Waiting for More,
+    # an Overflow Comes Back With No Directory Since Any Watch May Have Lost Events
+    def read(self) -> Iterator[tuple[str | None, str, int]]:
+        while True:
+            try:
+                data = os.read(self.fd, EVENT_READ_SIZE)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    yield None, "", mask
+                    continue
+                # Events Still Queued for a Watch That Was Removed are Dropped
+                for directory in list(self._directories.get(wd, ())):
+                    # The Kernel Drops the Watch Itself Once the Directory is Gone
+                    if mask & DIRECTORY_GONE:
+                        self.remove(directory)
+                    yield directory, name, mask
+
+
+# Builtins Plus Every Executable on $PATH, Kept Current by Applying Only What Changed
+class CommandIndex(CompletionIndex):
+    def __init__(self, builtins: Iterable[str]) -> None:
+        self._builtins = frozenset(builtins)
+        super().__init__(self._builtins)
+        # Directory -> Executable Names, and How Many Directories Provide Each Name
+        self._listings: dict[str, set[str]] = {}
+        self._providers: dict[str, int] = {}
+        # Directories inotify Could Not Watch, Re-Read When Their mtime Moves
+        self._mtimes: dict[str, int | None] = {}
+        self._path: str | None = None
+        self._watcher = DirectoryWatcher.open()
+        self.refresh()
+
+    # Cheap When Nothing Changed: One Non-Blocking read, Plus a stat per Polled Directory
+    def refresh(self) -> None:
+        path = os.environ.get("PATH", "")
+        if path != self._path:
+            self._set_path(path)
+
+        if self._watcher is not None:
+            for directory, name, mask in self._watcher.read():
+                if directory is None:
+                    for directory in list(self._listings):
+                        self._rescan(directory)
+                elif mask & DIRECTORY_GONE:
+                    self._rescan(directory)
+                    self._mtimes[directory] = dir_mtime(directory)
+                elif directory in self._listings:
+                    self._update(directory, name)
+
+        for directory, mtime in list(self._mtimes.items()):
+            if (current := dir_mtime(directory)) != mtime:
+                # A Directory Created Later May Now be Watchable Instead of Polled
+                if current is not None and self._watch(directory):
+                    del self._mtimes[directory]
+                else:
+                    self._mtimes[directory] = current
+                self._rescan(directory)
+
+    # Directories Kept Across a PATH Change are Not Read Again
+    def _set_path(self, path: str) -> None:
+        directories = dict.fromkeys(entry for entry in path.split(os.pathsep) if entry)
+        for directory in [entry for entry in self._listings if entry not in directories]:
+            if self._watcher is not None:
+                self._watcher.remove(directory)
+            self._mtimes.pop(directory, None)
+            for name in self._listings.pop(directory):
+                self._withdraw(name)
+
+        for directory in directories:
+            if directory in self._listings:
+                continue
+            # Watching Starts Before the Scan so an Entry Added Mid-Scan is Not Missed
+            if not self._watch(directory):
+                self._mtimes[directory] = dir_mtime(directory)
+            self._listings[directory] = set()
+            self._rescan(directory)
+        self._path = path
+
+    def _watch(self, directory: str) -> bool:
+        return self._watcher is not None and self._watcher.add(directory)
+
+    def _rescan(self, directory: str) -> None:
+        old = self._listings[directory]
+        new = set(list_executables(directory))
+        for name in new - old:
+            self._provide(name)
+        for name in old - new:
+            self._withdraw(name)
+        self._listings[directory] = new
+
+    # One Entry Changed, Checking it Again Covers Creates, Deletes, Renames and chmod
+    def _update(self, directory: str, name: str) -> None:
+        listing = self._listings[directory]
+        executable = is_executable(os.path.join(directory, name))
+        if executable and name not in listing:
+            listing.add(name)
+            self._provide(name)
+        elif not executable and name in listing:
+            listing.discard(name)
+            self._withdraw(name)
+
+    def _provide(self, name: str) -> None:
+        self._providers[name] = self._providers.get(name, 0) + 1
+        self.add(name)
+
+    # A Name Leaves the Index Only Once No Directory Provides it and it is Not a Builtin
+    def _withdraw(self, name: str) -> None:
+        if (count := self._providers[name] - 1) > 0:
+            self._providers[name] = count
+            return
+        del self._providers[name]
+        if name not in self._builtins:
+            self.discard(name)
+
+
+def list_executables(directory: str) -> Iterator[str]:
+    try:
+        with os.scandir(directory) as entries:
+            for item in entries:
+                try:
+                    if item.is_file() and os.access(item.path, os.X_OK):
+                        yield item.name
+                except OSError:
+                    continue
+    except OSError:
+        return
@@ -1,118 +1,496 @@
-import sys, os, io, signal
-from typing import Callable
+import sys, os, io, signal, tempfile, threading, contextlib
+from typing import Callable, Iterable, Iterator
 from app.cmd_lib import CommandLibrary
 from app.cmd_result import CommandResult
+from app.jobs import Job
+from app.spawn import SpawnedProcess
+from app.parser import (
+    CommandList,
+    FunctionDefinition,
+    Pipeline,
+    ParseError,
+    parse,
+    build_pipeline,
+    is_incomplete,
+)
+from app.trace import TRACER, traced
+from app.usage import Timing, note_spawn
+from app.expand import Word, positional
 from app.utils import (
+    CONTINUATION_PROMPT,
+    FORCE_EXIT_STATUS,
     ExitStatus,
+    ForceExit,
     Redirection,
     Prompt,
-    parse_tokens,
     setup_pipes,
-    close_child_pipes,
+    stdin_from_bytes,
 )
 
 
+# Captured Substitution Output Moves From Memory to a Temporary File Past This Size
+SUBSTITUTION_SPILL_SIZE = 1 << 20
+SUBSTITUTION_READ_SIZE = 1 << 16
+# Aliases and Functions Every Interactive Session Starts With
+RC_ENV = "PERSONAL_SHELL_RC"
+DEFAULT_RC_FILE = "~/.personalshellrc"
+
+
 class PersonalShell:
-    def __init__(self) -> None:
-        self.cmd_lib = CommandLibrary()
-        self.prompter = Prompt()
+    def __init__(self, interactive: bool = True) -> None:
+        self.cmd_lib = CommandLibrary(interactive, self.call)
+        # Readline and Completion Setup is Only Needed When a Person is Typing
+        self.prompter = Prompt(history=self.cmd_lib.history) if interactive else None
+        self.last_status = 0
+        if interactive:
+            self.load_rc()
+
+    # Runs the rc File Once so its Definitions are Parsed Before the First Prompt
+    def load_rc(self) -> None:
+        rc_path = os.path.expanduser(os.environ.get(RC_ENV, DEFAULT_RC_FILE))
+        try:
+            with open(rc_path) as rc:
+                lines = rc.readlines()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            sys.stderr.write(f"{rc_path}: {e.strerror}\n")
+            return
+        self.run_batch(lines)
+        self.last_status = 0
 
     def run(self) -> None:
+        # History is Indexed While the User Types, Not While the Shell Starts
+        if self.cmd_lib.history is not None:
+            self.cmd_lib.history.index_in_background()
+
         while True:
-            child_pids = []
             try:
-                user_input = self.prompter.ask()
+                # Report Background Jobs That Finished While the Last Command Ran
+                for notice in self.cmd_lib.jobs.notify():
+                    print(notice)
+
+                with TRACER.span("Prompt.check_and_refresh"):
+                    self.prompter.check_and_refresh()
+
+                with TRACER.span("Prompt.ask"):
+                    user_input = self.read_command()
 
                 # User Input Does Not Exist Case
                 if not user_input:
                     continue
 
-                # Each Pipe Section is Executed on Child Process
-                pipe_sections, last_cmdline = parse_tokens(user_input)
-                stdin_pipe = None
-                for cmdline in pipe_sections:
-                    stdin_pipe, pid = self.execute_cmdline_pipe(
-                        user_input, cmdline, stdin_pipe
-                    )
-                    child_pids.append(pid)
-
-                # Execute Last Command Line On Parent Process
-                self.execute_last_cmdline(user_input, last_cmdline, stdin_pipe)
+                self.execute_line(user_input)
 
             except KeyboardInterrupt:
                 break
 
+    # Keeps Asking While a Quote or Function Body is Still Open, Then Records the Whole Command
+    def read_command(self) -> str:
+        user_input = self.prompter.ask()
+        while user_input and is_incomplete(user_input):
+            user_input = f"{user_input}\n{self.prompter.ask(CONTINUATION_PROMPT)}"
+        if user_input and self.cmd_lib.history is not None:
+            self.cmd_lib.history.append(user_input)
+        return user_input
+
+    # Streams Commands Through the Same Parser and Executor Without Any Prompt
+    def run_batch(self, lines: Iterable[str], parse_all: bool = False) -> int:
+        commands = script_lines(lines)
+        # Optionally Parse the Whole Script Up Front so Each Line Only Opens its Files
+        if parse_all:
+            try:
+                commands = [(line, parse(line)) for line in commands]
+            except ParseError as e:
+                sys.stderr.write(f"{e}\n")
+                return ExitStatus.SYNTAX.value
+            for line, command_list in commands:
+                self.execute_line(line, command_list)
+        else:
+            for line in commands:
+                self.execute_line(line)
+        return self.last_status
+
+    @traced("execute_line")
+    def execute_line(
+        self, user_input: str, command_list: CommandList | None = None
+    ) -> None:
+        # Syntax Errors are Reported and the Shell Keeps Going
+        try:
+            with TRACER.span("parse"):
+                command_list = command_list or parse(user_input)
+        except ParseError as e:
+            sys.stderr.write(f"{e}\n")
+            self.last_status = ExitStatus.SYNTAX.value
+            return
+        if not command_list:
+            return
+
+        # && and || Skip Their Pipeline Based on the Status Left by the Last One That Ran
+        for connector, pipeline in command_list.items:
+            if connector == "&&" and self.last_status != 0:
+                continue
+            if connector == "||" and self.last_status == 0:
+                continue
+            if isinstance(pipeline, FunctionDefinition):
+                self.cmd_lib.define(pipeline)
+                self.last_status = 0
+                continue
+            self.execute_pipeline(pipeline)
+
+    # Runs an Alias or Function Body in This Shell With the Call Site's Files as its Own
+    def call(
+        self, body: CommandList, context: Redirection, arguments: list[str] | None
+    ) -> int:
+        output = spool = context.output_file
+        try:
+            output.fileno()
+        except io.UnsupportedOperation:
+            # Commands in the Body Need a Descriptor to Write a Buffered Pipe Section To
+            output = spool = tempfile.TemporaryFile("w+")
+        else:
+            spool = None
+
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(contextlib.redirect_stdout(output))
+            stack.enter_context(contextlib.redirect_stderr(context.error_file))
+            if context.input_file is not None:
+                stack.enter_context(self.reading(context.input_file))
+            if arguments is not None:
+                stack.enter_context(positional(arguments))
+            self.execute_line("", body)
+
+        if spool is not None:
+            with spool:
+                spool.seek(0)
+                context.output_file.write(spool.read())
+        return self.last_status
+
+    # Piped or Redirected Input Becomes the Body's fd 0, Read Directly Rather Than Through a PTY
+    @contextlib.contextmanager
+    def reading(self, input_file: io.TextIOWrapper):
+        saved_fd = os.dup(0)
+        interactive, self.cmd_lib.interactive = self.cmd_lib.interactive, False
+        os.dup2(input_file.fileno(), 0)
+        try:
+            yield
+        finally:
+            os.dup2(saved_fd, 0)
+            os.close(saved_fd)
+            self.cmd_lib.interactive = interactive
+
+    # A time Keyword Reports Once the Pipeline Finishes, Background Pipelines are Not Waited For
+    def execute_pipeline(self, pipeline: Pipeline) -> None:
+        if not pipeline.timed or pipeline.background:
+            self.run_pipeline(pipeline)
+            return
+
+        with Timing() as timing:
+            self.run_pipeline(pipeline)
+        sys.stdout.flush()
+        sys.stderr.write("\n".join(timing.report()) + "\n")
+        sys.stderr.flush()
+
+    def run_pipeline(self, pipeline: Pipeline) -> None:
+        user_input = pipeline.text
+        try:
+            pipe_sections, last_cmdline, background = build_pipeline(
+                pipeline, self.last_status, self.substitute
+            )
+        except ParseError as e:
+            sys.stderr.write(f"{e}\n")
+            self.last_status = 1
+            return
+        job = Job(user_input, background)
+        try:
+            # Only External Pipe Sections Get Their Own Process
+            stdin_pipe = None
+            for cmdline in pipe_sections:
+                stdin_pipe, process = self.execute_cmdline_pipe(
+                    user_input, cmdline, stdin_pipe, job
+                )
+                if process:
+                    job.add(process)
+
+            if background:
+                self.execute_background_cmdline(user_input, last_cmdline, stdin_pipe, job)
+                self.last_status = 0
+                return
+
+            # Execute Last Command Line On Parent Process
+            self.last_status = self.execute_last_cmdline(
+                user_input, last_cmdline, stdin_pipe
+            )
+
+        finally:
+            if not background:
+                self.clean_cmds(job)
+
+    # Runs a $(...) in This Process With Subshell Semantics and Returns its Output
+    def substitute(self, command: str) -> str:
+        try:
+            command_list = parse(command)
+        except ParseError as e:
+            sys.stderr.write(f"{e}\n")
+            return ""
+        if not command_list:
+            return ""
+
+        # Builtin Only Substitutions Print Straight Into a String, No Pipe or Thread Needed
+        if self.builtins_only(command_list):
+            buffer = io.StringIO()
+            with contextlib.redirect_stdout(buffer):
+                self.execute_substitution(command, command_list)
+            return buffer.getvalue()
+
+        # Children Write Into a Pipe Drained by a Thread so a Full Pipe Never Stalls Them
+        read_fd, write_fd = os.pipe()
+        with tempfile.SpooledTemporaryFile(SUBSTITUTION_SPILL_SIZE) as spool:
+            reader = threading.Thread(target=drain, args=(read_fd, spool), daemon=True)
+            reader.start()
+            try:
+                with open(write_fd, "w") as pipe, contextlib.redirect_stdout(pipe):
+                    self.execute_substitution(command, command_list)
             finally:
-                self.clean_cmds(child_pids)
+                reader.join()
+                os.close(read_fd)
+            spool.seek(0)
+            return spool.read().decode(errors="replace")
+
+    # Definitions Only Record a Function, Which Never Needs a Pipe
+    def builtins_only(self, command_list: CommandList) -> bool:
+        return all(
+            not isinstance(command.argv[0], Word)
+            and self.cmd_lib.runs_in_process(command.argv[0])
+            for _, pipeline in command_list.items
+            if not isinstance(pipeline, FunctionDefinition)
+            for command in pipeline.commands
+        )
+
+    # cd, exit and the Like Inside a Substitution Never Reach the Shell Itself
+    def execute_substitution(self, command: str, command_list: CommandList) -> None:
+        with self.cmd_lib.subshell():
+            try:
+                self.execute_line(command, command_list)
+            except SystemExit as e:
+                self.last_status = e.code if isinstance(e.code, int) else 0
 
     def execute_last_cmdline(
         self,
         user_input: str,
         cmdline: tuple[str, list[str], Redirection],
         stdin_pipe: io.TextIOWrapper,
-    ) -> None:
+    ) -> int:
         cmd, args, context = cmdline
         context.set_input(stdin_pipe)
         command_func = self.cmd_lib.find_command(context, cmd, user_input)
-        self.execute(command_func, args, context.close)
+        return self.execute(command_func, args, context.close)
+
+    # Starts the Last Section Without Waiting, Registering the Whole Pipeline as a Job
+    def execute_background_cmdline(
+        self,
+        user_input: str,
+        cmdline: tuple[str, list[str], Redirection],
+        stdin_pipe: io.TextIOWrapper,
+        job: Job,
+    ) -> None:
+        cmd, args, context = cmdline
+        context.set_input(stdin_pipe)
+
+        if self.cmd_lib.is_defined(cmd):
+            job.add(self.fork_defined(user_input, cmdline, job.process_group))
+        elif spawner := self.cmd_lib.find_spawner(context, cmd):
+            try:
+                if process := spawner(args, job.process_group):
+                    job.add(process)
+            finally:
+                context.close()
+        else:
+            command_func = self.cmd_lib.find_command(context, cmd, user_input)
+            self.execute_isolated(cmd, command_func, args, context.close, job)
+
+        if job.done:
+            return
+        job_id = self.cmd_lib.jobs.add(job)
+        print(f"[{job_id}] {job.pids[-1]}")
 
     def execute_cmdline_pipe(
         self,
         user_input: str,
         cmdline: tuple[str, list[str], Redirection],
         stdin_pipe: io.TextIOWrapper,
-    ) -> tuple[io.TextIOWrapper, int]:
+        job: Job,
+    ) -> tuple[io.TextIOWrapper, SpawnedProcess | None]:
         cmd, args, context = cmdline
+        if self.cmd_lib.is_defined(cmd):
+            stdin_pipe = setup_pipes(context, stdin_pipe)
+            # The Next Section's Read End Must Not Stay Open in the Subshell Writing to It
+            return stdin_pipe, self.fork_defined(
+                user_input, cmdline, job.process_group, stdin_pipe
+            )
+        if self.cmd_lib.runs_in_process(cmd):
+            return self.execute_inprocess_pipe(user_input, cmdline, stdin_pipe, job), None
+
         stdin_pipe = setup_pipes(context, stdin_pipe)
-        # Search Command Library for Correct Function To Use
-        command_func = self.cmd_lib.find_command(context, cmd, user_input)
 
+        # External Commands Read and Write the Pipe File Descriptors Themselves
+        spawner = self.cmd_lib.find_spawner(context, cmd)
+        try:
+            return stdin_pipe, spawner(args, job.process_group)
+        finally:
+            context.close()
+
+    # Runs an Alias or Function Section in a Forked Subshell, Concurrently With the Rest
+    # of the Pipeline, so a Reader That Stops Early Also Stops the Body
+    def fork_defined(
+        self,
+        user_input: str,
+        cmdline: tuple[str, list[str], Redirection],
+        process_group: int | None,
+        next_stdin: io.TextIOWrapper | None = None,
+    ) -> SpawnedProcess:
+        cmd, args, context = cmdline
+        context.flush()
+        sys.stdout.flush()
+        sys.stderr.flush()
         pid = os.fork()
-        if pid == 0:
-            # Only Child Process Do Commands of Piped Sections
-            self.execute(
-                command_func, args, lambda: close_child_pipes(context, stdin_pipe)
-            )
-        else:
+        if pid:
+            # Set on Both Sides so the Group Exists Whichever Runs First
+            if process_group is not None:
+                with contextlib.suppress(OSError):
+                    os.setpgid(pid, process_group or pid)
             context.close()
-            return stdin_pipe, pid
+            note_spawn(pid, [cmd, *args])
+            return SpawnedProcess(pid)
+
+        status = FORCE_EXIT_STATUS
+        try:
+            if process_group is not None:
+                os.setpgid(0, process_group)
+            # Writing to a Closed Pipe Ends the Subshell Quietly, Like Any Other Command
+            signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            if next_stdin is not None:
+                next_stdin.close()
+            for fd, file in (
+                (0, context.input_file),
+                (1, context.output_file),
+                (2, context.error_file),
+            ):
+                if file is not None and file.fileno() != fd:
+                    os.dup2(file.fileno(), fd)
+            # The Body Sees Plain Descriptors, Never a PTY of its Own
+            self.cmd_lib.interactive = False
+            section = Redirection([], {}, True)
+            command_func = self.cmd_lib.find_command(section, cmd, user_input)
+            status = self.execute(command_func, args, section.close)
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 0
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(status & 0xFF)
+
+    # Runs a Builtin Section Without Forking, Buffering its Output for the Next Section
+    def execute_inprocess_pipe(
+        self,
+        user_input: str,
+        cmdline: tuple[str, list[str], Redirection],
+        stdin_pipe: io.TextIOWrapper,
+        job: Job,
+    ) -> io.TextIOWrapper:
+        cmd, args, context = cmdline
+        context.set_input(stdin_pipe)
+        command_func = self.cmd_lib.find_command(context, cmd, user_input)
+
+        # Section Outputs to File -> Next Section Reads the File, Same as an External Section
+        if context.output_redirected:
+            self.execute_isolated(cmd, command_func, args, context.close, job)
+            return open(context.output_file.name, "r")
+
+        # Backed by Bytes so Output a Builtin Replays Verbatim Reaches the Next Section Intact
+        buffer = io.TextIOWrapper(io.BytesIO(), encoding="utf-8", write_through=True)
+        context.set_output(buffer)
+        self.execute_isolated(cmd, command_func, args, lambda: None, job)
+        buffer.flush()
+        data = buffer.buffer.getvalue()
+        context.close()
+        return stdin_from_bytes(data)
+
+    # Gives State Changing Builtins Subshell Semantics, a Bare exit Ends the Shell Once the Job is Done
+    def execute_isolated(
+        self,
+        cmd: str,
+        command_func: Callable[[list[str]], CommandResult],
+        args: list[str],
+        closure: Callable[[], None],
+        job: Job,
+    ) -> int:
+        try:
+            with self.cmd_lib.isolation(cmd):
+                return self.execute(command_func, args, closure)
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 0
+            job.force_exit |= isinstance(e, ForceExit)
+            return status
 
     def execute(
         self,
         command_func: Callable[[list[str]], CommandResult],
         args: list[str],
         closure: Callable[[], None],
-    ) -> None:
+    ) -> int:
         # Allow The Closing of Output Files Even With Crashes
         try:
             result = command_func(args)
             result.output()
+            return result.status
         finally:
             closure()
 
-    def clean_cmds(self, child_pids: list[int]) -> None:
-        while True:
-            try:
-                # Waits for Any Child Process Exit, Nonblockingly
-                pid, status = os.waitpid(-1, 0)
-                child_pids.remove(pid)
-
-                # Checks if the Exited Child Process is Forced
-                if (
-                    os.WIFEXITED(status)
-                    and os.WEXITSTATUS(status) == ExitStatus.FORCEEXIT.value
-                ):
-                    # Kills All Child Process Safely and Parent Process
-                    self.terminate_all_cmds(child_pids)
-
-            except ChildProcessError:
-                break
+    # Waits on the Foreground Job's Own Children Only, Background Jobs are Left Running
+    @traced("clean_cmds")
+    def clean_cmds(self, job: Job) -> None:
+        job.wait()
+        # Checks if a Builtin Section Asked the Shell to Exit
+        if job.force_exit:
+            # Kills the Job's Remaining Children Safely and Parent Process
+            self.terminate_all_cmds(job)
 
-    def terminate_all_cmds(self, child_pids: list[int]) -> None:
-        # Loops through Child PIDs and kill them safely
-        for pid in child_pids:
+    def terminate_all_cmds(self, job: Job) -> None:
+        # Loops through the Job's Child PIDs and kill them safely
+        for pid in job.running_pids:
             try:
                 os.kill(pid, signal.SIGTERM)
             except ProcessLookupError:
                 pass
         sys.exit()
+
+
+# Copies a Pipe Into the Spool Until Every Writer Has Closed its End
+def drain(read_fd: int, spool: tempfile.SpooledTemporaryFile) -> None:
+    while data := os.read(read_fd, SUBSTITUTION_READ_SIZE):
+        spool.write(data)
+
+
+# Skips Blank Lines and Whole Line Comments of a Script, Joining Lines Until Each Command is Whole
+def script_lines(lines: Iterable[str]) -> Iterator[str]:
+    pending = ""
+    for line in lines:
+        # Lines Continuing a Quote are Kept Exactly as Written
+        if pending:
+            line = line.rstrip("\n")
+            pending = f"{pending}\n{line}"
+        elif (line := line.strip()) and not line.startswith("#"):
+            pending = line
+        else:
+            continue
+        if not is_incomplete(pending):
+            yield pending
+            pending = ""
+    # Input Ending Inside a Body Still Runs, so the Syntax Error is Reported
+    if pending:
+        yield pending
+
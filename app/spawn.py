@@ -0,0 +1,165 @@
+import os, sys, signal, termios, tempfile
+from typing import IO
+from app.usage import note_spawn, wait_child
+from app.utils import ExitStatus
+
+
+# Python Ignores These at Startup, Children Expect the Defaults Back
+DEFAULT_SIGNALS = (signal.SIGPIPE, signal.SIGXFSZ)
+STANDARD_FDS = (0, 1, 2)
+# Stands in For a Stream the Parent Wants to Read, Same Idea as subprocess.PIPE
+PIPE = -1
+
+
+# Mirrors the Parts of Popen the Shell Uses: pid, stdout, stderr and wait
+class SpawnedProcess:
+    def __init__(self, pid: int, stdout: IO | None = None, stderr: IO | None = None) -> None:
+        self.pid = pid
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode: int | None = None
+
+    def wait(self) -> int:
+        if self.returncode is None:
+            try:
+                _, status = wait_child(self.pid)
+                self.returncode = os.waitstatus_to_exitcode(status)
+            except ChildProcessError:
+                # Already Reaped by the Job Table
+                self.returncode = 0
+        return self.returncode
+
+
+# Starts a Program Through posix_spawn, the Interpreter's Memory is Never Copied
+def spawn(
+    file_path: str,
+    argv: list[str],
+    stdin: IO | int | None = None,
+    stdout: IO | int | None = None,
+    stderr: IO | int | None = None,
+    process_group: int | None = None,
+    env: dict[str, str] | None = None,
+) -> SpawnedProcess:
+    file_actions, readers, child_ends = [], [], []
+    try:
+        for target, source in zip(STANDARD_FDS, (stdin, stdout, stderr)):
+            reader = None
+            if source is None:
+                readers.append(reader)
+                continue
+            if source == PIPE:
+                read_fd, fd = os.pipe()
+                reader = open(read_fd, "rb", buffering=0)
+                child_ends.append(fd)
+            else:
+                fd = source if isinstance(source, int) else source.fileno()
+            readers.append(reader)
+            # dup2 Onto Itself Leaves Close-on-exec Set, Only Real Moves are Listed
+            if fd != target:
+                file_actions.append((os.POSIX_SPAWN_DUP2, fd, target))
+
+        options = {} if process_group is None else {"setpgroup": process_group}
+        pid = os.posix_spawn(
+            file_path,
+            argv,
+            os.environ if env is None else env,
+            file_actions=file_actions,
+            setsigdef=DEFAULT_SIGNALS,
+            **options,
+        )
+    except BaseException:
+        for reader in readers:
+            if reader:
+                reader.close()
+        raise
+    finally:
+        for fd in child_ends:
+            os.close(fd)
+    note_spawn(pid, argv)
+    return SpawnedProcess(pid, readers[1], readers[2])
+
+
+# Runs a Program to Completion With No Input, Capturing Both Streams in Full
+def capture(
+    file_path: str, argv: list[str], env: dict[str, str] | None = None
+) -> tuple[int, bytes, bytes]:
+    with (
+        open(os.devnull, "rb") as stdin,
+        tempfile.TemporaryFile() as stdout,
+        tempfile.TemporaryFile() as stderr,
+    ):
+        process = spawn(file_path, argv, stdin=stdin, stdout=stdout, stderr=stderr, env=env)
+        status = process.wait()
+        stdout.seek(0)
+        stderr.seek(0)
+        return status, stdout.read(), stderr.read()
+
+
+# Spawns a Program as Session Leader of a Fresh PTY, Returning (pid, Master fd)
+def spawn_pty(
+    file_path: str, argv: list[str], env: dict[str, str] | None = None
+) -> tuple[int, int]:
+    global setsid_supported
+    env = os.environ if env is None else env
+    if not setsid_supported:
+        return fork_pty(file_path, argv, env)
+
+    master_fd, slave_fd = os.openpty()
+    try:
+        # Child Starts With the Right Size Instead of Waiting For the First Resize
+        copy_window_size(slave_fd)
+
+        # Opening the Slave After setsid Makes it the Child's Controlling Terminal
+        pid = os.posix_spawn(
+            file_path,
+            argv,
+            env,
+            file_actions=[
+                (os.POSIX_SPAWN_OPEN, 0, os.ttyname(slave_fd), os.O_RDWR, 0),
+                (os.POSIX_SPAWN_DUP2, 0, 1),
+                (os.POSIX_SPAWN_DUP2, 0, 2),
+            ],
+            setsid=True,
+            setsigdef=DEFAULT_SIGNALS,
+        )
+    except NotImplementedError:
+        # Python Built Against a libc Without POSIX_SPAWN_SETSID
+        os.close(master_fd)
+        setsid_supported = False
+        return fork_pty(file_path, argv, env)
+    except BaseException:
+        os.close(master_fd)
+        raise
+    finally:
+        os.close(slave_fd)
+    note_spawn(pid, argv)
+    return pid, master_fd
+
+
+# Fallback Where posix_spawn Cannot setsid, the Child Does Nothing But Reset Signals and exec
+def fork_pty(file_path: str, argv: list[str], env: dict[str, str]) -> tuple[int, int]:
+    pid, master_fd = os.forkpty()
+    if pid == 0:
+        try:
+            for signum in DEFAULT_SIGNALS:
+                signal.signal(signum, signal.SIG_DFL)
+            os.execve(file_path, argv, env)
+        except OSError as e:
+            os.write(2, f"{argv[0]}: {e.strerror}\n".encode())
+        finally:
+            os._exit(ExitStatus.NOEXEC.value)
+
+    copy_window_size(master_fd)
+    note_spawn(pid, argv)
+    return pid, master_fd
+
+
+def copy_window_size(fd: int) -> None:
+    if os.isatty(sys.stdin.fileno()):
+        try:
+            termios.tcsetwinsize(fd, termios.tcgetwinsize(sys.stdin.fileno()))
+        except (OSError, termios.error):
+            pass
+
+
+setsid_supported = True
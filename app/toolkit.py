@@ -0,0 +1,58 @@
+from prompt_toolkit import prompt
+from prompt_toolkit.shortcuts import CompleteStyle
+from prompt_toolkit.completion import Completer, Completion
+from prompt_toolkit.history import History as ToolkitHistory
+from app.completion import CompletionIndex, DirectoryCache, completes_command, finish_path
+from app.history import History
+
+
+class ShellCompleter(Completer):
+    def __init__(
+        self, index: CompletionIndex, paths: DirectoryCache, ignore_case: bool = True
+    ) -> None:
+        self.index = index
+        self.paths = paths
+        self.ignore_case = ignore_case
+
+    def get_completions(self, document, complete_event):
+        # Single Bisect Lookup for the Word Under the Cursor
+        word = document.get_word_before_cursor(WORD=True)
+        before = document.text_before_cursor[: len(document.text_before_cursor) - len(word)]
+        if not completes_command(before, word):
+            yield from self.path_completions(word)
+            return
+
+        for cmd in self.index.prefix(word, self.ignore_case):
+            # Return the Completed Value with Whitespace appended
+            yield Completion(text=f"{cmd} ", start_position=-len(word), display=cmd)
+
+    def path_completions(self, word: str):
+        for path in self.paths.complete(word, self.ignore_case):
+            name = path.rstrip("/").rpartition("/")[2]
+            display = f"{name}/" if path.endswith("/") else name
+            yield Completion(text=finish_path(path), start_position=-len(word), display=display)
+
+
+# Feeds Prompt Toolkit the Latest Entries, the Shell Itself Records Each Line
+class ShellHistory(ToolkitHistory):
+    def __init__(self, history: History) -> None:
+        super().__init__()
+        self.history = history
+
+    def load_history_strings(self):
+        yield from self.history.recent()
+
+    def store_string(self, string: str) -> None:
+        pass
+
+
+# Asks a prompt using Prompt Toolkit
+def tool_ask(
+    completer: ShellCompleter, history: ShellHistory | None = None, message: str = "$ "
+) -> str:
+    return prompt(
+        message,
+        completer=completer,
+        complete_style=CompleteStyle.MULTI_COLUMN,
+        history=history,
+    ).strip()
@@ -0,0 +1,120 @@
+import os, sys, json, time, threading, functools
+from collections import deque
+from typing import Callable
+
+
+TRACE_ENV = "PERSONAL_SHELL_TRACE"
+TRACE_BUFFER_SIZE = 65536
+DEFAULT_TRACE_FILE = "personal-shell-trace.json"
+
+
+# Times One Phase of a Command, Recording it Into the Ring Buffer on Exit
+class Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer: "Tracer", name: str, args: dict) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *_) -> None:
+        end = time.perf_counter_ns()
+        self.tracer.record(self.name, self.start, end - self.start, self.args)
+
+
+# Stands in for a Span While Tracing is Off so Call Sites Never Branch
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "NullSpan":
+        return self
+
+    def __exit__(self, *_) -> None:
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+    def __init__(self, capacity: int = TRACE_BUFFER_SIZE) -> None:
+        self.enabled = False
+        self.path: str | None = None
+        self.owner = os.getpid()
+        # Oldest Spans Fall Off the Front Once the Buffer is Full, Appends are Thread Safe
+        self.spans: deque[tuple[str, int, int, int, dict]] = deque(maxlen=capacity)
+
+    # Resolved Now so a Later cd Does Not Move Where the Trace is Written
+    def enable(self, path: str | None = None) -> None:
+        self.path = os.path.abspath(path or self.path or DEFAULT_TRACE_FILE)
+        self.owner = os.getpid()
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def span(self, name: str, **args) -> Span | NullSpan:
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, args)
+
+    def record(self, name: str, start: int, duration: int, args: dict) -> None:
+        self.spans.append((name, start, duration, threading.get_ident(), args))
+
+    # Chrome Trace Event Format, Loadable in chrome://tracing or Perfetto
+    def events(self) -> list[dict]:
+        pid = os.getpid()
+        return [
+            {
+                "name": name,
+                "ph": "X",
+                "ts": start / 1000,
+                "dur": duration / 1000,
+                "pid": pid,
+                "tid": tid,
+                "args": args,
+            }
+            for name, start, duration, tid, args in list(self.spans)
+        ]
+
+    # Writes Out Everything Still in the Buffer, Returning the File Written
+    def dump(self, path: str | None = None) -> str | None:
+        path = path or self.path
+        # Forked Children Hold a Copy of the Buffer and Must Not Overwrite the Shell's File
+        if not path or not self.spans or os.getpid() != self.owner:
+            return None
+        with open(path, "w") as trace_file:
+            json.dump({"traceEvents": self.events(), "displayTimeUnit": "ms"}, trace_file)
+        return path
+
+
+# Registered With atexit, a Trace That Cannot be Written is Reported Rather Than Raised
+def dump_at_exit() -> None:
+    try:
+        TRACER.dump()
+    except OSError as e:
+        sys.stderr.write(f"personal-shell: trace: {e.filename}: {e.strerror}\n")
+
+
+# Wraps a Function in a Span, Costing One Attribute Check While Tracing is Off
+def traced(name: str) -> Callable[[Callable], Callable]:
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return func(*args, **kwargs)
+            with Span(TRACER, name, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+TRACER = Tracer()
+if trace_path := os.environ.get(TRACE_ENV, None):
+    TRACER.enable(trace_path)
@@ -0,0 +1,108 @@
+import os, time, resource
+
+
+# CPU Seconds and Peak Resident Set Size in KiB, as Reported by getrusage and wait4
+class Usage:
+    __slots__ = ("user", "system", "maxrss")
+
+    def __init__(self, user: float = 0.0, system: float = 0.0, maxrss: int = 0) -> None:
+        self.user = user
+        self.system = system
+        self.maxrss = maxrss
+
+    @classmethod
+    def from_rusage(cls, rusage: resource.struct_rusage) -> "Usage":
+        return cls(rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss)
+
+    # CPU Times Add Up, Peak Memory is the Largest of the Two
+    def __add__(self, other: "Usage") -> "Usage":
+        return Usage(
+            self.user + other.user,
+            self.system + other.system,
+            max(self.maxrss, other.maxrss),
+        )
+
+
+# Collects the Usage of Every Child Reaped While it is Active, Keyed by pid in Spawn Order
+class Timing:
+    def __enter__(self) -> "Timing":
+        self.names: dict[int, str] = {}
+        self.children: dict[int, Usage] = {}
+        self.real = 0.0
+        self.shell = Usage()
+        self._start = time.perf_counter()
+        self._shell_start = resource.getrusage(resource.RUSAGE_SELF)
+        ACTIVE_TIMINGS.append(self)
+        return self
+
+    def __exit__(self, *_) -> None:
+        ACTIVE_TIMINGS.remove(self)
+        self.real = time.perf_counter() - self._start
+        end = resource.getrusage(resource.RUSAGE_SELF)
+        # Builtins and the Shell's Own Relaying Run Here, Charged as One Extra Stage
+        self.shell = Usage(
+            end.ru_utime - self._shell_start.ru_utime,
+            end.ru_stime - self._shell_start.ru_stime,
+            end.ru_maxrss,
+        )
+
+    # Totals in the Layout of bash's time, Followed by One Line per Stage
+    def report(self) -> list[str]:
+        stages = [
+            (name, self.children[pid])
+            for pid, name in self.names.items()
+            if pid in self.children
+        ]
+        stages += [
+            (str(pid), usage)
+            for pid, usage in self.children.items()
+            if pid not in self.names
+        ]
+        stages.append(("(shell)", self.shell))
+
+        total = Usage()
+        for _, usage in stages:
+            total += usage
+        lines = [
+            "",
+            f"real\t{format_seconds(self.real)}",
+            f"user\t{format_seconds(total.user)}",
+            f"sys\t{format_seconds(total.system)}",
+            f"maxrss\t{total.maxrss}k",
+            "",
+            "user\tsys\tmaxrss\tstage",
+        ]
+        lines += [
+            f"{format_seconds(usage.user)}\t{format_seconds(usage.system)}\t{usage.maxrss}k\t{name}"
+            for name, usage in stages
+        ]
+        return lines
+
+
+# Children of the Whole Session, Everything Ever Reaped Through wait_child
+SESSION_USAGE = Usage()
+ACTIVE_TIMINGS: list[Timing] = []
+
+
+def format_seconds(seconds: float) -> str:
+    minutes, seconds = divmod(seconds, 60)
+    return f"{int(minutes)}m{seconds:.3f}s"
+
+
+# waitpid That Also Keeps the Child's rusage, Returning (pid, Status) Just Like waitpid
+def wait_child(pid: int, options: int = 0) -> tuple[int, int]:
+    global SESSION_USAGE
+    reaped, status, rusage = os.wait4(pid, options)
+    # A Stopped Child Has Not Finished Using Resources Yet
+    if reaped and not os.WIFSTOPPED(status):
+        usage = Usage.from_rusage(rusage)
+        SESSION_USAGE += usage
+        for timing in ACTIVE_TIMINGS:
+            timing.children[reaped] = usage
+    return reaped, status
+
+
+# Names a Child for the Stage Lines of Any Timing in Progress
+def note_spawn(pid: int, argv: list[str]) -> None:
+    for timing in ACTIVE_TIMINGS:
+        timing.names[pid] = " ".join(argv)
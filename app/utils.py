@@ -1,14 +1,38 @@
-import sys, os, shlex, io, re, readline
+import sys, os, io, readline, fcntl, select, tempfile, functools
 from pathlib import Path
-from typing import Iterator, Callable
 from enum import Enum
-from prompt_toolkit import prompt
-from prompt_toolkit.shortcuts import CompleteStyle
-from prompt_toolkit.completion import WordCompleter, Completion
+from app.completion import (
+    CompletionIndex,
+    BackgroundIndex,
+    DirectoryCache,
+    completes_command,
+    finish_path,
+)
+from app.history import History
+from app.pathwatch import CommandIndex, list_executables
+
+
+# Only Whitespace and Operators End a Word Being Completed
+COMPLETER_DELIMS = " \t\n|&;<>"
+# Prompts for a New Command and for Each Further Line of an Unfinished One
+PRIMARY_PROMPT = "$ "
+CONTINUATION_PROMPT = "> "
 
 
 class ExitStatus(Enum):
-    FORCEEXIT = 127
+    SYNTAX = 2
+    NOEXEC = 126
+    NOTFOUND = 127
+
+
+# Status a Bare exit Leaves Behind, Also Reported by a Child That Dies Before Finishing
+FORCE_EXIT_STATUS = 127
+
+
+# Raised Only by a Bare exit, Which Ends the Whole Shell Even From Inside a Pipeline
+class ForceExit(SystemExit):
+    def __init__(self) -> None:
+        super().__init__(FORCE_EXIT_STATUS)
 
 
 class Commands(Enum):
@@ -17,88 +41,39 @@ class Commands(Enum):
     TYPE = "type"
     PWD = "pwd"
     CD = "cd"
+    HASH = "hash"
+    WHICH = "which"
+    JOBS = "jobs"
+    FG = "fg"
+    BG = "bg"
+    WAIT = "wait"
+    SET = "set"
+    HISTORY = "history"
+    ENABLE = "enable"
+    PARALLEL = "parallel"
+    TIMES = "times"
+    ALIAS = "alias"
+    UNALIAS = "unalias"
+    CACHED = "cached"
+    CACHE = "cache"
 
     @classmethod
     def get_commands(cls) -> list[str]:
         commands = {cmd.value for cmd in cls}
         for path in os.getenv("PATH", "").split(os.pathsep):
-            try:
-                with os.scandir(path) as entries:
-                    for item in entries:
-                        if item.is_file() and os.access(item.path, os.X_OK):
-                            commands.add(item.name)
-            except (OSError, PermissionError):
-                continue
+            commands.update(list_executables(path))
         return list(commands)
 
 
 class Channel(Enum):
+    INPUT_CH = "input_ch"
     OUTPUT_CH = "output_ch"
     ERROR_CH = "error_ch"
+    READ_MODE = "r"
     WRITE_MODE = "w"
     APPEND_MODE = "a"
-
-
-OPERATORS = {
-    ">": (Channel.OUTPUT_CH, Channel.WRITE_MODE),
-    "1>": (Channel.OUTPUT_CH, Channel.WRITE_MODE),
-    "2>": (Channel.ERROR_CH, Channel.WRITE_MODE),
-    ">>": (Channel.OUTPUT_CH, Channel.APPEND_MODE),
-    "1>>": (Channel.OUTPUT_CH, Channel.APPEND_MODE),
-    "2>>": (Channel.ERROR_CH, Channel.APPEND_MODE),
-}
-
-OP_PATTERN = re.compile(r"(1>>|2>>|1>|2>|>>|>)")
-
-
-def operator_finder(tokenizer: shlex.shlex) -> Iterator[str]:
-    for token in tokenizer:
-        if ">" in token:
-            parts = re.split(OP_PATTERN, token)
-            yield from (p for p in parts if p)
-        else:
-            yield token
-
-
-def parse_tokens(user_input: str) -> list[tuple[str, list[str], Redirection]]:
-    input_stream = io.StringIO(user_input)
-    tokenizer = shlex.shlex(input_stream, posix=True, punctuation_chars="|")
-    tokenizer.whitespace_split = True
-    final_tokenizer = operator_finder(tokenizer)
-
-    pipe_sections = []
-    cmdline, redirects, channels = [], [], {}
-
-    while token := next(final_tokenizer, ""):
-        # Define a Section of the Pipeline
-        if token == "|":
-            cmd, *args = cmdline
-            pipe_sections.append((cmd, args, Redirection(redirects, channels, True)))
-            cmdline, redirects, channels = [], [], {}
-            continue
-
-        # Determine What Channel, Output or Error, & Mode, Write or Append, is Being Adjusted
-        op_configs = OPERATORS.get(token, None)
-        if not op_configs:
-            cmdline.append(token)
-            continue
-
-        # Grab File Name of New Redirection
-        channel_name = tokenizer.get_token()
-        if not channel_name:
-            sys.stdout.write("parse error near `\\n'\n")
-            sys.exit(0)
-
-        # Previous Redirection Gets Logged For Continued File Creation
-        if channel := channels.get(op_configs[0], None):
-            redirects.append(channel[0])
-
-        # Current Redirection Becomes Actual Output or Error File with New Mode
-        channels[op_configs[0]] = (channel_name, op_configs[1])
-
-    cmd, *args = cmdline
-    is_piped = len(pipe_sections) > 0
-    return pipe_sections, (cmd, args, Redirection(redirects, channels, is_piped))
+    # The Target is the Input Text Itself, From a Here-Document or Here-String
+    HERE_MODE = "here"
 
 
 def setup_pipes(
@@ -107,7 +82,7 @@ def setup_pipes(
     # Setting stdin of Current Pipe Section
     context.set_input(prev_stdin_pipe)
 
-    if context.output_file.isatty():
+    if not context.output_redirected:
         # Current Pipe Section Outputs to stdout -> Instead Redirect its Outputs to Pipes
         piped_ends = os.pipe()
         context.set_output(os.fdopen(piped_ends[1], context.output_file.mode))
@@ -120,10 +95,45 @@ def setup_pipes(
     return next_stdin_pipe
 
 
-def close_child_pipes(pipe: Redirection, extra: io.TextIOWrapper) -> None:
-    pipe.close()
-    extra.close()
-    sys.exit(0)
+# Linux Reports the Real Capacity, Elsewhere Only PIPE_BUF Bytes are Guaranteed to Fit
+def pipe_capacity(fd: int) -> int:
+    if (get_size := getattr(fcntl, "F_GETPIPE_SZ", None)) is None:
+        return select.PIPE_BUF
+    return fcntl.fcntl(fd, get_size)
+
+
+# Hands Already Produced Output to the Next Pipe Section Without Any Writer Left Running
+def stdin_from_bytes(data: bytes) -> io.TextIOWrapper:
+    read_end, write_end = os.pipe()
+    try:
+        # Fits in the Pipe Buffer -> Write it All Up Front, the Write Never Blocks
+        if len(data) <= pipe_capacity(write_end):
+            os.write(write_end, data)
+            return os.fdopen(read_end, "r")
+    finally:
+        os.close(write_end)
+
+    # Too Large for the Pipe -> Back it with an Anonymous In-Memory File Instead
+    os.close(read_end)
+    if hasattr(os, "memfd_create"):
+        buffer = os.fdopen(os.memfd_create("pipe-section"), "w+b")
+    else:
+        buffer = tempfile.TemporaryFile()
+    buffer.write(data)
+    buffer.seek(0)
+    return io.TextIOWrapper(buffer)
+
+
+# Standard Streams Never Change Terminal Status, Each is Probed Once
+@functools.cache
+def std_isatty(fd: int) -> bool:
+    return os.isatty(fd)
+
+
+def is_terminal(file: io.TextIOWrapper) -> bool:
+    if file is sys.stdout or file is sys.stderr or file is sys.stdin:
+        return std_isatty(file.fileno())
+    return file.isatty()
 
 
 class Redirection:
@@ -137,17 +147,32 @@ class Redirection:
         )
         self._close_input = self.close_output = self.close_error = lambda: None
         self.is_piped = is_piped
-
-        # Redirect Output
-        if output_ch := channels.get(Channel.OUTPUT_CH, None):
-            self.set_output(open(output_ch[0], output_ch[1].value))
-
-        # Redirect Error
-        if error_ch := channels.get(Channel.ERROR_CH, None):
-            self.set_error(open(error_ch[0], error_ch[1].value))
-
-        for fn in redirects:
-            Path(fn).touch()
+        self.input_redirected = self.output_redirected = False
+
+        # Files That Fail to Open Leave None of the Others Open Behind Them
+        try:
+            # Redirect Input, a File is Handed to the Child as its stdin Descriptor As Is
+            if input_ch := channels.get(Channel.INPUT_CH, None):
+                if input_ch[1] == Channel.HERE_MODE:
+                    self.set_input(stdin_from_bytes(input_ch[0].encode()))
+                else:
+                    self.set_input(open(input_ch[0], input_ch[1].value))
+                self.input_redirected = True
+
+            # Redirect Output
+            if output_ch := channels.get(Channel.OUTPUT_CH, None):
+                self.set_output(open(output_ch[0], output_ch[1].value))
+                self.output_redirected = True
+
+            # Redirect Error
+            if error_ch := channels.get(Channel.ERROR_CH, None):
+                self.set_error(open(error_ch[0], error_ch[1].value))
+
+            for fn in redirects:
+                Path(fn).touch()
+        except OSError:
+            self.close()
+            raise
 
     # Closes All Open Files
     def close(self) -> None:
@@ -155,13 +180,21 @@ class Redirection:
         self.close_output()
         self.close_error()
 
+    # Pushes Pending Text Out Before a Child Process Writes to the Same Files
+    def flush(self) -> None:
+        self.output_file.flush()
+        self.error_file.flush()
+
     def is_redirected(self) -> bool:
-        return self.is_piped or not (
-            self.output_file.isatty() and self.error_file.isatty()
+        return self.is_piped or self.input_redirected or not (
+            is_terminal(self.output_file) and is_terminal(self.error_file)
         )
 
     def set_input(self, input_file: io.TextIOWrapper | None) -> None:
-        if input_file:
+        # An Explicit < Wins Over the Previous Pipe Section, Whose Read End is Just Closed
+        if input_file and self.input_redirected:
+            input_file.close()
+        elif input_file:
             self.input_file = input_file
             self._close_input = input_file.close
 
@@ -179,43 +212,53 @@ class Redirection:
         self._close_input = lambda: None
 
 
-class ShellCompleter(WordCompleter):
-    def get_completions(self, document, complete_event):
-        # Grab Completed Objects from Original Completer
-        for comp in super().get_completions(document, complete_event):
-            # Return the Same Completed Value Except with Whitespace appended
-            yield Completion(
-                text=f"{comp.text} ",
-                start_position=comp.start_position,
-                display=comp.display_text,
-                display_meta=comp.display_meta,
-            )
-
-
 class Prompt:
-    def __init__(self, prompt_toolkit=False):
+    def __init__(self, prompt_toolkit=False, history: History | None = None):
+        self.history = history
+        self._toolkit_history = None
+        self._paths = DirectoryCache()
         if prompt_toolkit:
             self._completer_generator = self._shell_completer
             self.ask = self._tool_ask
         else:
             self._completer_generator = self._readline_completer
-            self.ask = lambda: input("$ ")
+            self.ask = lambda message=PRIMARY_PROMPT: input(message)
+            self._load_readline_history()
+
+        # PATH is Scanned Off the Startup Path, the First Tab Waits Only if it is Still Running
+        self._commands = BackgroundIndex(
+            lambda: CommandIndex(cmd.value for cmd in Commands)
+        )
+        self._command_completer = self._completer_generator(self._commands)
 
-        self._command_completer = self._completer_generator(Commands.get_commands())
-        self._last_path = os.environ.get("PATH", "")
+    # Creates a Command Completer for Prompt Toolkit, Imported Only When This Backend is Used
+    def _shell_completer(self, index: CompletionIndex):
+        from app.toolkit import ShellCompleter
 
-    # Creates a Command Completer for Prompt Toolkit
-    def _shell_completer(self, cmds: list[str]) -> ShellCompleter:
-        return ShellCompleter(cmds, ignore_case=True, WORD=True)
+        return ShellCompleter(index, self._paths, ignore_case=True)
 
     # Creates a Command Completer for Readline Module
-    def _readline_completer(self, cmds: list[str]) -> None:
+    def _readline_completer(self, index: CompletionIndex) -> None:
+        # Readline Asks Once per State, so Matches are Looked Up Only When Text Changes
+        last_text, possible_commands = None, []
+
         def command_completer(text, state):
-            possible_commands = [cmd for cmd in cmds if cmd.startswith(text)]
+            nonlocal last_text, possible_commands
+            if state == 0 or text != last_text:
+                last_text = text
+                before = readline.get_line_buffer()[: readline.get_begidx()]
+                if completes_command(before, text):
+                    possible_commands = [f"{cmd} " for cmd in index.prefix(text)]
+                else:
+                    possible_commands = [
+                        finish_path(path) for path in self._paths.complete(text)
+                    ]
             if state < len(possible_commands):
-                return f"{possible_commands[state]} "
+                return possible_commands[state]
             return None
 
+        # Paths Complete as Whole Words, so / and - Must Not Split Them
+        readline.set_completer_delims(COMPLETER_DELIMS)
         # Parse and Bind Tab Button based on OS system, Mac or Linux
         readline.set_completer(command_completer)
         if "libedit" in readline.__doc__:
@@ -224,17 +267,22 @@ class Prompt:
             readline.parse_and_bind("tab: complete")
         return
 
+    # Hands Readline Only the Latest Entries, Older Ones are Reached Through history -f
+    def _load_readline_history(self) -> None:
+        if self.history is not None:
+            for entry in reversed(self.history.recent()):
+                readline.add_history(entry)
+
     # Asks a prompt using Prompt Toolkit
-    def _tool_ask(self) -> str:
-        return prompt(
-            "$ ",
-            completer=self._command_completer,
-            complete_style=CompleteStyle.MULTI_COLUMN,
-        ).strip()
-
-    # Refreshes List of Commands that exist and corresponding completer
+    def _tool_ask(self, message: str = PRIMARY_PROMPT) -> str:
+        from app.toolkit import tool_ask, ShellHistory
+
+        if self.history is not None and self._toolkit_history is None:
+            self._toolkit_history = ShellHistory(self.history)
+        return tool_ask(self._command_completer, self._toolkit_history, message)
+
+    # Applies What Changed on PATH Since the Last Prompt, the Completer Keeps the Same Index
     def check_and_refresh(self) -> None:
-        current_path = os.environ.get("PATH", "")
-        if self._last_path != current_path:
-            self._command_completer = self._completer_generator(Commands.get_commands())
-            self._last_path = current_path
+        # A Scan Still Running Picks Up Every Change Anyway, the Prompt Never Waits on it
+        if self._commands.ready():
+            self._commands.get().refresh()
@@ -0,0 +1,100 @@
+import os, sys, pty, time, atexit, select, shutil, termios, tempfile, functools
+from app.history import HISTORY_ENV
+from app.memo import CACHE_ENV
+from app.shell import RC_ENV
+
+PROMPT = b"$ "
+TIMEOUT = 10.0
+SHELL_COMMAND = [sys.executable, "-m", "app.main"]
+
+
+# Created Once per Run and Removed on Exit
+@functools.cache
+def scratch_home() -> str:
+    home = tempfile.mkdtemp(prefix="shell-bench-home-")
+    atexit.register(shutil.rmtree, home, True)
+    return home
+
+
+# Benchmarked Shells Never Load the User's rc File or Write to Their History and Cache
+def shell_env() -> dict[str, str]:
+    home = scratch_home()
+    return {
+        **os.environ,
+        "HOME": home,
+        RC_ENV: os.path.join(home, ".personalshellrc"),
+        HISTORY_ENV: os.path.join(home, ".personal_shell_history"),
+        CACHE_ENV: os.path.join(home, "cache"),
+    }
+
+
+# Runs an Interactive Shell on a Pseudo Terminal and Times Lines Until the Next Prompt
+class ShellDriver:
+    def __init__(self, command: list[str] = SHELL_COMMAND) -> None:
+        self.buffer = bytearray()
+        # Built Before Forking so the Child Shares the Parent's Scratch HOME
+        env = shell_env()
+        self.pid, self.master_fd = pty.fork()
+        if self.pid == 0:
+            os.execvpe(command[0], command, env)
+        termios.tcsetwinsize(self.master_fd, (24, 80))
+        self.read_until(PROMPT)
+
+    # Consumes Output Up to and Including Marker, Keeping Anything Read Past It
+    def read_until(self, marker: bytes) -> bytes:
+        deadline = time.perf_counter() + TIMEOUT
+        searched = 0
+        # Only the Newly Read Tail is Searched, Large Outputs Stay Linear
+        while (end := self.buffer.find(marker, searched)) < 0:
+            searched = max(len(self.buffer) - len(marker) + 1, 0)
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError(f"waited for {marker!r}, got {self.buffer[-200:]!r}")
+            ready, _, _ = select.select([self.master_fd], [], [], remaining)
+            if ready:
+                self.buffer += os.read(self.master_fd, 65536)
+        end += len(marker)
+        output = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return output
+
+    # Seconds From Sending a Line to the Next Prompt Appearing
+    def run(self, line: str) -> float:
+        start = time.perf_counter()
+        os.write(self.master_fd, f"{line}\n".encode())
+        # The Echoed Line Comes Back First, Then the Command Output and Prompt
+        self.read_until(b"\n")
+        self.read_until(PROMPT)
+        return time.perf_counter() - start
+
+    def send(self, data: bytes) -> None:
+        os.write(self.master_fd, data)
+
+    # Seconds From Writing a Keystroke to the Terminal Echoing it Back
+    def round_trip(self, key: bytes) -> float:
+        start = time.perf_counter()
+        os.write(self.master_fd, key)
+        self.read_until(key)
+        return time.perf_counter() - start
+
+    def close(self) -> None:
+        try:
+            os.write(self.master_fd, b"exit\n")
+            os.waitpid(self.pid, 0)
+        finally:
+            os.close(self.master_fd)
+
+
+# Seconds to Run a Whole Batch Script, Including Interpreter Startup
+def run_batch(script: str, command: list[str] = SHELL_COMMAND) -> float:
+    import subprocess
+
+    start = time.perf_counter()
+    subprocess.run(
+        [*command, "-c", script],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env=shell_env(),
+        check=False,
+    )
+    return time.perf_counter() - start
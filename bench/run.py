@@ -0,0 +1,262 @@
+import os, sys, json, time, stat, argparse, platform, subprocess, tempfile
+from bench.driver import ShellDriver, run_batch
+from bench.startup import time_to_first_prompt, summarize
+
+SUITE_VERSION = 1
+DEFAULT_ITERATIONS = 50
+THROUGHPUT_MB = 256
+PTY_THROUGHPUT_MB = 16
+SYNTHETIC_PATH_SIZE = 30000
+DEFAULT_THRESHOLD = 0.15
+STARTUP_GRACE = 0.3
+# Enough Lines Per Script That Interpreter Startup Noise Does Not Swamp the Per-Line Cost
+BATCH_MIN_COMMANDS = 500
+
+
+def bench_startup(iterations: int) -> dict:
+    time_to_first_prompt(ShellDriverCommand.command)
+    return summarize(
+        [time_to_first_prompt(ShellDriverCommand.command) for _ in range(iterations)]
+    )
+
+
+# Builtins Stay In-Process, External Commands Pay for Process Creation
+def bench_command_latency(iterations: int) -> dict:
+    driver = ShellDriver(ShellDriverCommand.command)
+    try:
+        results = {}
+        for name, line in (
+            ("builtin_echo", "echo x"),
+            ("builtin_type", "type ls"),
+            ("external_true", "true"),
+            ("external_pipeline", "true | true | true"),
+            ("builtin_pipeline", "echo x | echo y | echo z"),
+        ):
+            driver.run(line)
+            results[name] = summarize([driver.run(line) for _ in range(iterations)])
+        return results
+    finally:
+        driver.close()
+
+
+# Per-Command Cost Without a Terminal, Interpreter Startup is Subtracted Out
+def bench_batch_latency(iterations: int) -> dict:
+    baseline = min(run_batch("") for _ in range(5))
+    count = max(iterations, BATCH_MIN_COMMANDS)
+    results = {}
+    for name, line in (("builtin_echo", "echo x"), ("external_true", "true")):
+        script = "\n".join([line] * count)
+        elapsed = min(run_batch(script) for _ in range(3))
+        results[name] = {"per_command_ms": (elapsed - baseline) / count * 1000}
+    return results
+
+
+def make_payload(directory: str, size_mb: int) -> str:
+    path = os.path.join(directory, f"payload-{size_mb}.txt")
+    line = b"0123456789abcdefghijklmnopqrstuvwxyz ABCDEFGHIJKLMNOPQRSTUVWXYZ 0123456789\n"
+    with open(path, "wb") as payload:
+        block = line * (1024 * 1024 // len(line) + 1)
+        for _ in range(size_mb):
+            payload.write(block[: 1024 * 1024])
+    return path
+
+
+# MB/s Through External Pipe Stages, the PipeCommandResult Drain and the PTY Relay
+def bench_pipeline_throughput(workdir: str) -> dict:
+    payload = make_payload(workdir, THROUGHPUT_MB)
+    results = {}
+    for name, pipeline in (
+        ("cat_to_file", f"cat {payload} > /dev/null"),
+        ("three_stage", f"cat {payload} | cat | cat > /dev/null"),
+        ("grep_wc", f"cat {payload} | grep abc | wc -l > /dev/null"),
+    ):
+        elapsed = min(run_batch(pipeline) for _ in range(3))
+        results[name] = {"mb_per_s": THROUGHPUT_MB / elapsed}
+
+    results["drain"] = {"mb_per_s": THROUGHPUT_MB / drain_seconds(payload)}
+
+    small_payload = make_payload(workdir, PTY_THROUGHPUT_MB)
+    driver = ShellDriver(ShellDriverCommand.command)
+    try:
+        driver.run("true")
+        for name, line in (
+            ("pty_relay", f"cat {small_payload}"),
+            ("terminal_relay", f"cat {small_payload} | cat"),
+        ):
+            results[name] = {"mb_per_s": PTY_THROUGHPUT_MB / driver.run(line)}
+    finally:
+        driver.close()
+    return results
+
+
+# Drives PipeCommandResult Directly so Only the Python Side of the Relay is Measured
+def drain_seconds(payload: str) -> float:
+    from app.cmd_result import PipeCommandResult
+    from app.utils import Redirection
+
+    with open(os.devnull, "w") as sink:
+        context = Redirection([], {}, True)
+        context.set_output(sink)
+        process = subprocess.Popen(
+            ["cat", payload], stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0
+        )
+        start = time.perf_counter()
+        PipeCommandResult(
+            context, stdout=process.stdout, stderr=process.stderr, process=process
+        ).output()
+        return time.perf_counter() - start
+
+
+# Keystroke to Echo Latency While an Interactive Command Owns the PTY
+def bench_pty_round_trip(iterations: int) -> dict:
+    driver = ShellDriver(ShellDriverCommand.command)
+    try:
+        driver.send(b"cat\n")
+        driver.read_until(b"cat\r\n")
+        # Keys Typed Before cat Owns the Terminal Would Be Echoed by the Outer Line Discipline
+        time.sleep(STARTUP_GRACE)
+        samples = [driver.round_trip(b"k") for _ in range(iterations)]
+        driver.send(b"\n\x04")
+        driver.read_until(b"$ ")
+        return summarize(samples)
+    finally:
+        driver.close()
+
+
+# Index Build and Prefix Lookups Against a Synthetic PATH Full of Executables
+def bench_completion(workdir: str, iterations: int) -> dict:
+    from app.completion import CompletionIndex
+    from app.utils import Commands
+
+    bin_dir = os.path.join(workdir, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    for i in range(SYNTHETIC_PATH_SIZE):
+        path = os.path.join(bin_dir, f"tool-{i:05d}")
+        with open(path, "w"):
+            pass
+        os.chmod(path, stat.S_IRWXU)
+
+    old_path = os.environ.get("PATH", "")
+    os.environ["PATH"] = f"{bin_dir}{os.pathsep}{old_path}"
+    try:
+        start = time.perf_counter()
+        index = CompletionIndex(Commands.get_commands())
+        build = time.perf_counter() - start
+    finally:
+        os.environ["PATH"] = old_path
+
+    samples = []
+    for i in range(iterations):
+        prefix = f"tool-{i % 300:03d}"
+        start = time.perf_counter()
+        index.prefix(prefix)
+        samples.append(time.perf_counter() - start)
+    return {
+        "entries": len(index),
+        "build_ms": build * 1000,
+        "lookup": summarize(samples),
+    }
+
+
+class ShellDriverCommand:
+    command = [sys.executable, "-m", "app.main"]
+
+
+BENCHMARKS = {
+    "startup": lambda options, workdir: bench_startup(options.iterations // 5 or 1),
+    "command_latency": lambda options, workdir: bench_command_latency(
+        options.iterations
+    ),
+    "batch_latency": lambda options, workdir: bench_batch_latency(options.iterations),
+    "pipeline_throughput": lambda options, workdir: bench_pipeline_throughput(workdir),
+    "pty_round_trip": lambda options, workdir: bench_pty_round_trip(options.iterations),
+    "completion": lambda options, workdir: bench_completion(
+        workdir, options.iterations * 20
+    ),
+}
+
+# Metrics Where a Bigger Number is Better, Everything Else is a Duration
+HIGHER_IS_BETTER = ("mb_per_s",)
+
+
+def flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and key != "runs":
+            flat[name] = value
+    return flat
+
+
+# Lists Metrics That Moved the Wrong Way by More Than the Threshold
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    old_metrics = flatten(baseline["results"])
+    for name, value in flatten(current["results"]).items():
+        old = old_metrics.get(name, None)
+        if not old or name.endswith(("entries", "max_ms")):
+            continue
+        change = (value - old) / old
+        if name.endswith(HIGHER_IS_BETTER):
+            change = -change
+        if change > threshold:
+            regressions.append(f"{name}: {old:.3f} -> {value:.3f} ({change:+.0%})")
+    return regressions
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Personal shell benchmark suite")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS))
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare", help="baseline JSON file to check against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--cmd", nargs="+", help="shell command line to benchmark")
+    options = parser.parse_args()
+    if options.cmd:
+        ShellDriverCommand.command = options.cmd
+
+    report = {
+        "suite_version": SUITE_VERSION,
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="shell-bench-") as workdir:
+        for name in options.only or BENCHMARKS:
+            sys.stderr.write(f"running {name}...\n")
+            report["results"][name] = BENCHMARKS[name](options, workdir)
+
+    text = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, "w") as output:
+            output.write(f"{text}\n")
+    else:
+        sys.stdout.write(f"{text}\n")
+
+    if options.compare:
+        with open(options.compare) as baseline:
+            regressions = compare(report, json.load(baseline), options.threshold)
+        for regression in regressions:
+            sys.stderr.write(f"REGRESSION {regression}\n")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import os, sys, pty, time, json, select, argparse, statistics
+from bench.driver import shell_env
+
+PROMPT = b"$ "
+DEFAULT_RUNS = 20
+TIMEOUT = 10.0
+
+
+# Spawns the Shell Under a Pseudo Terminal and Times Until the First Prompt is Drawn
+def time_to_first_prompt(command: list[str], env: dict[str, str] | None = None) -> float:
+    env = env or shell_env()
+    start = time.perf_counter()
+    pid, master_fd = pty.fork()
+    if pid == 0:
+        os.execvpe(command[0], command, env)
+
+    output = b""
+    try:
+        while PROMPT not in output:
+            if time.perf_counter() - start > TIMEOUT:
+                raise TimeoutError(f"no prompt after {TIMEOUT}s: {output!r}")
+            ready, _, _ = select.select([master_fd], [], [], TIMEOUT)
+            if ready:
+                output += os.read(master_fd, 1024)
+        return time.perf_counter() - start
+    finally:
+        os.write(master_fd, b"exit\n")
+        os.waitpid(pid, 0)
+        os.close(master_fd)
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    return {
+        "runs": len(samples),
+        "min_ms": min(samples) * 1000,
+        "median_ms": statistics.median(samples) * 1000,
+        "max_ms": max(samples) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time-to-first-prompt benchmark")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    parser.add_argument(
+        "--cmd", nargs="+", default=[sys.executable, "-m", "app.main"]
+    )
+    args = parser.parse_args()
+
+    # First Run Warms the Page Cache and Bytecode, it is Not Counted
+    time_to_first_prompt(args.cmd)
+    samples = [time_to_first_prompt(args.cmd) for _ in range(args.runs)]
+    json.dump({"time_to_first_prompt": summarize(samples)}, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()